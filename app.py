@@ -1,20 +1,35 @@
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for, flash
+from flask import Flask, render_template, request, jsonify, session, redirect, url_for, flash, g, Response, stream_with_context, make_response, send_from_directory
 from flask_socketio import SocketIO, emit, join_room, leave_room
 from flask_migrate import Migrate
 from werkzeug.utils import secure_filename
-from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.exceptions import HTTPException
+from werkzeug.security import check_password_hash
+from argon2 import PasswordHasher
+from argon2.exceptions import VerificationError, InvalidHashError
 from datetime import datetime, timedelta
+from functools import wraps
+from concurrent.futures import ThreadPoolExecutor
+import itertools
 import os
-import json
-import time
+import re
+import html
+import hashlib
+import hmac
+import orjson
+import uuid
+import secrets
 import logging
-import random
 import string
+import threading
 from dotenv import load_dotenv
 
+# Class codes double as join tokens, so draw them from the OS CSPRNG
+CLASS_CODE_ALPHABET = string.ascii_uppercase + string.digits
+_class_code_rng = secrets.SystemRandom()
+
 def generate_class_code():
     """Generate a unique 6-character alphanumeric code"""
-    return ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
+    return ''.join(_class_code_rng.choices(CLASS_CODE_ALPHABET, k=6))
 
 # Load environment variables from .env file BEFORE importing modules that use them
 load_dotenv()
@@ -26,10 +41,32 @@ from modules.adaptive_quiz_generator import AdaptiveQuizGenerator
 from modules.skill_tree_engine import SkillTreeEngine
 from modules.exam_predictor import ExamPredictor
 from modules.leaderboard_engine import LeaderboardEngine
+from modules.ttl_cache import TTLCache, RedisTTLCache
+from modules.json_provider import OrjsonProvider
 
 # Initialize Flask app
 app = Flask(__name__)
 app.config.from_object(Config)
+if app.config['PROXY_FIX_X_FOR']:
+    from werkzeug.middleware.proxy_fix import ProxyFix
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['PROXY_FIX_X_FOR'])
+
+# Serialize all jsonify() responses with orjson
+app.json = OrjsonProvider(app)
+
+# OTP digests are keyed with OTP_PEPPER / SECRET_KEY
+email_service.init_app(app)
+
+# Server-side sessions (and rate-limit counters) in Redis when configured;
+# otherwise Flask's signed-cookie session and in-process counters
+redis_client = None
+if app.config['REDIS_URL']:
+    import redis
+    from flask_session import Session
+    redis_client = redis.from_url(app.config['REDIS_URL'])
+    app.config['SESSION_TYPE'] = 'redis'
+    app.config['SESSION_REDIS'] = redis_client
+    Session(app)
 
 # Ensure upload directory exists
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
@@ -40,7 +77,8 @@ sa_db.init_app(app)
 migrate = Migrate(app, sa_db)
 
 # Initialize Database Manager (PostgreSQL via SQLAlchemy engine)
-db = db_manager.DatabaseManager(app.config['DATABASE_URL'])
+db = db_manager.DatabaseManager(app.config['DATABASE_URL'], session_options=app.config['DB_SESSION_OPTIONS'])
+app.teardown_appcontext(db.close_request_connection)
 
 adaptive = adaptive_learning_new.AdaptiveEngine(db)
 kyknox = kyknox_ai_new.KyKnoX()
@@ -51,6 +89,55 @@ exam_predictor = ExamPredictor(db)
 leaderboard_engine = LeaderboardEngine(db)
 data_generator = demo_data_generator.DemoDataGenerator(db)
 
+# Short-lived cache for teacher feedback / analytics reads (cleared on quiz submission)
+analytics_cache = TTLCache(ttl=30, maxsize=256)
+# Class / lecture / quiz listings (invalidated by the write endpoints that change them)
+listing_cache = TTLCache(ttl=30, maxsize=512)
+# Dashboard class lists per ('teacher'|'student', user_id), so repeated refreshes skip the aggregate
+dashboard_cache = TTLCache(ttl=20, maxsize=10000)
+# Verified users' login rows by email (dropped whenever password_hash changes);
+# shared through Redis when available so a reset invalidates every worker at once
+if redis_client is not None:
+    login_cache = RedisTTLCache(redis_client, 'lvx:login:', ttl=300)
+else:
+    login_cache = TTLCache(ttl=300, maxsize=4096)
+# Last OTP email time per '<purpose>:<email>' — the resend cooldown, checked without a query
+if redis_client is not None:
+    otp_cooldown = RedisTTLCache(redis_client, 'lvx:otp-cooldown:', ttl=60)
+else:
+    otp_cooldown = TTLCache(ttl=60, maxsize=50000)
+# Active live session per class_id (False = none); students poll this, writes invalidate
+live_session_cache = TTLCache(ttl=30, maxsize=1024)
+# Fixed-window rate-limit counters when there is no Redis (entries expire with their window)
+rate_limit_counters = TTLCache(ttl=60, maxsize=8192)
+
+# Hot lookups shared by several handlers; translated once at import
+SQL_ENROLLMENT_CHECK = 'SELECT id FROM enrollments WHERE student_id = ? AND class_id = ?'
+SQL_ACTIVE_LIVE_SESSION = 'SELECT id, room_name, started_at FROM live_sessions WHERE class_id = ? AND is_active = 1'
+SQL_QUIZ_BY_ID = 'SELECT * FROM quizzes WHERE id = ?'
+SQL_AI_HISTORY = 'SELECT id, prompt, response, response_html, created_at FROM ai_queries WHERE user_id = ? ORDER BY created_at DESC LIMIT 50'
+SQL_INSERT_AI_QUERY = 'INSERT INTO ai_queries (user_id, prompt, response, response_html, provider, mode) VALUES (?, ?, ?, ?, ?, ?)'
+# Same reads/writes for databases not yet migrated to ai_queries.response_html
+SQL_AI_HISTORY_LEGACY = 'SELECT id, prompt, response, NULL as response_html, created_at FROM ai_queries WHERE user_id = ? ORDER BY created_at DESC LIMIT 50'
+SQL_INSERT_AI_QUERY_LEGACY = 'INSERT INTO ai_queries (user_id, prompt, response, provider, mode) VALUES (?, ?, ?, ?, ?)'
+db.prepare(SQL_ENROLLMENT_CHECK, SQL_ACTIVE_LIVE_SESSION, SQL_QUIZ_BY_ID, SQL_AI_HISTORY, SQL_INSERT_AI_QUERY)
+
+# Shared pool for work the response does not wait on (hash upgrades, notifications, ...)
+background_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='lvx-bg')
+# OTP emails wait on an SMTP handshake; sent after the OTP row is committed
+email_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='lvx-mail')
+# LLM calls take seconds; keep them off request threads and out of background_executor
+ai_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='lvx-ai')
+# Results of async chatbot jobs, polled via /api/chatbot/result/<task_id>; in Redis when
+# available so the poll may land on any worker
+if redis_client is not None:
+    chatbot_results = RedisTTLCache(redis_client, 'lvx:chatbot:', ttl=600)
+else:
+    chatbot_results = TTLCache(ttl=600, maxsize=2048)
+# Jobs still running in this process (task_id -> user_id); unlike chatbot_results
+# entries these are never evicted, so a busy cache cannot lose a pending job
+chatbot_inflight = {}
+
 # Initialize Learning Path Service
 from modules import learning_path, badges
 learning_path_service = learning_path.LearningPathService(db, adaptive_engine=adaptive)
@@ -68,132 +155,209 @@ app.register_blueprint(arena_bp)
 
 
 # Custom Jinja Filters
-app.jinja_env.filters['from_json'] = json.loads
+app.jinja_env.filters['from_json'] = orjson.loads
 
 # Initialize SocketIO with threading mode for Windows compatibility
 # Using 'threading' instead of 'eventlet' to avoid Windows-specific issues
-socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading')
+# With a redis:// REDIS_URL, emits are relayed through Redis pub/sub so rooms span every
+# worker process (the Socket.IO Redis manager does not take unix:// URLs)
+_socketio_queue = app.config['REDIS_URL'] if app.config['REDIS_URL'].startswith(('redis://', 'rediss://')) else None
+socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading',
+                    message_queue=_socketio_queue, channel=app.config['SOCKETIO_CHANNEL'])
 
 # Configure Logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Add cache control headers for development (disable caching)
+OTP_PURGE_INTERVAL = 300  # seconds
+
+def purge_expired_otps():
+    """Background sweep: delete expired OTP rows so the verify paths never have to."""
+    while True:
+        socketio.sleep(OTP_PURGE_INTERVAL)
+        try:
+            now = datetime.now()
+            db.execute_update('DELETE FROM password_reset_otp WHERE expires_at < ?', (now,))
+            db.execute_update('DELETE FROM otp_requests WHERE expires_at < ?', (now,))
+        except Exception as e:
+            logger.error(f"OTP purge failed: {e}")
+
+_background_jobs_started = False
+_background_jobs_lock = threading.Lock()
+
+def start_background_jobs():
+    """Start the periodic sweeps; called by the server entry points (wsgi.py, __main__),
+    never at import, so CLI and migration processes do not run them."""
+    global _background_jobs_started
+    with _background_jobs_lock:
+        if _background_jobs_started:
+            return
+        _background_jobs_started = True
+    socketio.start_background_task(purge_expired_otps)
+
+# Add cache control headers (disable caching in development)
 @app.after_request
 def add_no_cache_headers(response):
-    """Disable caching in debug mode to ensure latest code is always served"""
+    """Disable caching in debug mode to ensure latest code is always served.
+
+    In production, static files requested with a ?v= version (APP_VERSION in the
+    templates) are cached for a year; the URL changes on every release.
+    """
     if app.debug:
         response.headers['Cache-Control'] = 'no-store, no-cache, must-revalidate, max-age=0'
         response.headers['Pragma'] = 'no-cache'
         response.headers['Expires'] = '0'
+    elif request.endpoint == 'static' and request.args.get('v') and response.status_code in (200, 304):
+        response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
     return response
 
 # Helper Functions
 def get_current_user_id():
-    return session.get('user_id')
-
-def login_required(f):
-    """Decorator for page routes - redirects to login"""
-    from functools import wraps
-    @wraps(f)
-    def decorated_function(*args, **kwargs):
-        if 'user_id' not in session:
-            return redirect(url_for('auth.login'))
-        return f(*args, **kwargs)
-    return decorated_function
+    # The auth decorators stash the id on g; fall back to the session for undecorated routes
+    user_id = g.get('user_id')
+    return user_id if user_id is not None else session.get('user_id')
+
+def get_current_role():
+    role = g.get('role')
+    return role if role is not None else session.get('role')
+
+def _authenticate():
+    """Load user id / role from the session onto g. Returns False when not logged in."""
+    user_id = session.get('user_id')
+    if user_id is None:
+        return False
+    g.user_id = user_id
+    g.role = session.get('role')
+    return True
+
+def _wants_json():
+    """Whether a rejected request should get JSON rather than a redirect (API path or JSON body)."""
+    # Path check first: it is a plain string compare, is_json parses the Content-Type header
+    return request.path.startswith('/api/') or request.is_json
+
+def _static_json(payload, status):
+    """Encode a constant JSON reply once; views return the (body, status, headers) tuple as-is."""
+    return app.json.dumps_bytes(payload) + b'\n', status, {'Content-Type': app.json.mimetype}
+
+# Denials are hit by every unauthenticated poll / throttled client; their bodies never change
+API_UNAUTHORIZED = _static_json({'success': False, 'error': 'Unauthorized', 'message': 'Please login to continue'}, 401)
+API_TEACHERS_ONLY = _static_json({'success': False, 'error': 'Forbidden', 'message': 'Teachers only'}, 403)
+AUTH_REQUIRED = _static_json({'success': False, 'error': 'Authentication required'}, 401)
+TEACHER_REQUIRED = _static_json({'success': False, 'error': 'Teacher access required'}, 403)
+STUDENT_REQUIRED = _static_json({'success': False, 'error': 'Student access required'}, 403)
+RATE_LIMITED = _static_json({'success': False, 'error': 'Too Many Requests', 'message': 'Rate limit exceeded'}, 429)
 
 def api_login_required(f):
     """Decorator for API routes - returns JSON 401 instead of redirecting"""
-    from functools import wraps
-    @wraps(f)
-    def decorated_function(*args, **kwargs):
-        if 'user_id' not in session:
-            return jsonify({'success': False, 'error': 'Unauthorized', 'message': 'Please login to continue'}), 401
-        return f(*args, **kwargs)
-    return decorated_function
-
-def teacher_required(f):
-    from functools import wraps
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        if session.get('role') != 'teacher':
-            return "Access denied: Teachers only", 403
+        if not _authenticate():
+            return API_UNAUTHORIZED
         return f(*args, **kwargs)
     return decorated_function
 
 def api_teacher_required(f):
     """Decorator for API routes requiring teacher role - returns JSON 403"""
-    from functools import wraps
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        if session.get('role') != 'teacher':
-            return jsonify({'success': False, 'error': 'Forbidden', 'message': 'Teachers only'}), 403
+        if get_current_role() != 'teacher':
+            return API_TEACHERS_ONLY
         return f(*args, **kwargs)
     return decorated_function
 
 def login_required(f):
     """Decorator to require login for page and API routes."""
-    from functools import wraps
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        if 'user_id' not in session:
-            if request.is_json or request.path.startswith('/api/'):
-                return jsonify({'success': False, 'error': 'Authentication required'}), 401
+        if not _authenticate():
+            if _wants_json():
+                return AUTH_REQUIRED
             return redirect(url_for('auth.login', next=request.path))
         return f(*args, **kwargs)
     return decorated_function
 
 def teacher_required(f):
     """Decorator to require teacher role."""
-    from functools import wraps
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        if session.get('role') != 'teacher':
-            if request.is_json or request.path.startswith('/api/'):
-                return jsonify({'success': False, 'error': 'Teacher access required'}), 403
+        if get_current_role() != 'teacher':
+            if _wants_json():
+                return TEACHER_REQUIRED
             return redirect(url_for('index'))
         return f(*args, **kwargs)
     return decorated_function
 
 def student_required(f):
     """Decorator to require student role."""
-    from functools import wraps
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        if session.get('role') != 'student':
-            if request.is_json or request.path.startswith('/api/'):
-                return jsonify({'success': False, 'error': 'Student access required'}), 403
+        if get_current_role() != 'student':
+            if _wants_json():
+                return STUDENT_REQUIRED
             return redirect(url_for('index'))
         return f(*args, **kwargs)
     return decorated_function
 
 
 
-def rate_limit(calls=5, period=60):
-    """Simple per-session rate limit decorator.
+def _count_hit(key, period):
+    """Add one hit to key's fixed window and return the window's count."""
+    if redis_client is not None:
+        try:
+            # SET NX starts the window with its expiry; works on every Redis version
+            pipe = redis_client.pipeline()
+            pipe.set(key, 0, ex=period, nx=True)
+            pipe.incr(key)
+            return pipe.execute()[1]
+        except redis.RedisError:
+            logger.exception('Redis rate-limit counter failed; counting in-process')
+    return rate_limit_counters.incr(key, ttl=period)
+
+
+def rate_limit(calls=5, period=60, by=None):
+    """Fixed-window rate limit per user (or client address when logged out).
 
     calls: number of allowed calls within period (seconds)
     period: time window in seconds
+    by: optional callable returning another bucket to count in, e.g. the email an
+        OTP flow targets; stack the decorator to enforce several buckets.
+        A None bucket is not counted.
+
+    Counters live in Redis (SET NX EX + INCR, shared by all workers) when REDIS_URL
+    is set, otherwise (or while Redis errors) in-process; nothing is written to the
+    session cookie.
+    Rejections carry Retry-After: period (the window resets within it).
     """
-    from functools import wraps
+    limited = (RATE_LIMITED[0], RATE_LIMITED[1], {**RATE_LIMITED[2], 'Retry-After': str(period)})
+
     def decorator(f):
         @wraps(f)
         def wrapped(*args, **kwargs):
-            key = f'rl:{f.__name__}'
-            now = time.time()
-            store = session.setdefault('_rate_limits', {})
-            timestamps = store.get(key, [])
-            # Remove expired
-            timestamps = [t for t in timestamps if now - t < period]
-            if len(timestamps) >= calls:
-                return jsonify({'success': False, 'error': 'Too Many Requests', 'message': 'Rate limit exceeded'}), 429
-            timestamps.append(now)
-            store[key] = timestamps
-            session['_rate_limits'] = store
+            bucket = by() if by else session.get('user_id') or request.remote_addr
+            if bucket is not None:
+                if _count_hit(f'rl:{f.__name__}:{bucket}', period) > calls:
+                    return limited
             return f(*args, **kwargs)
         return wrapped
     return decorator
 
+
+def conditional(f):
+    """ETag successful responses and answer a matching If-None-Match with an empty 304.
+
+    Polled read endpoints re-send identical JSON most of the time; no-cache keeps
+    clients revalidating so fresh data still shows up immediately.
+    """
+    @wraps(f)
+    def wrapped(*args, **kwargs):
+        response = make_response(f(*args, **kwargs))
+        if response.status_code == 200 and not response.is_streamed:
+            response.add_etag()
+            response.headers.setdefault('Cache-Control', 'private, no-cache')
+            response = response.make_conditional(request)
+        return response
+    return wrapped
+
 # Standard JSON response helpers
 def json_success(message='OK', data=None, status=200, **extra):
     payload = {'success': True, 'message': message, 'data': data if data is not None else {}}
@@ -207,6 +371,35 @@ def json_error(message='Request failed', status=400, error=None, data=None, **ex
     return jsonify(payload), status
 
 
+def json_stream(rows):
+    """Stream an iterable of rows as a JSON array without materializing the whole body.
+
+    The first row is pulled before the response starts, so a query that fails
+    outright raises here and becomes a proper error status, not a truncated 200.
+    """
+    rows = iter(rows)
+    head = list(itertools.islice(rows, 1))
+
+    def generate():
+        try:
+            yield b'['
+            for i, row in enumerate(itertools.chain(head, rows)):
+                yield (b',' if i else b'') + app.json.dumps_bytes(row)
+            yield b']\n'
+        finally:
+            # Release the source's connection even if the client goes away mid-stream
+            if hasattr(rows, 'close'):
+                rows.close()
+    return Response(stream_with_context(generate()), mimetype='application/json')
+
+
+def get_active_live_session(class_id):
+    """Return the active live_sessions row for class_id, or None."""
+    return live_session_cache.get_or_set(
+        int(class_id), lambda: db.execute_one(SQL_ACTIVE_LIVE_SESSION, (class_id,)) or False
+    ) or None
+
+
 def get_json_payload():
     if not request.is_json:
         return None
@@ -214,6 +407,22 @@ def get_json_payload():
     return data if isinstance(data, dict) else None
 
 
+_table_columns = {}
+
+def table_columns(table_name):
+    """Column names of a public table; the schema only changes with a deploy, so cache per process."""
+    cols = _table_columns.get(table_name)
+    if cols is None:
+        rows = db.execute_query(
+            "SELECT column_name FROM information_schema.columns WHERE table_schema='public' AND table_name = %s",
+            (table_name,)
+        )
+        cols = {row['column_name'] for row in rows}
+        if cols:
+            _table_columns[table_name] = cols
+    return cols
+
+
 def table_exists(table_name):
     row = db.execute_one(
         "SELECT table_name FROM information_schema.tables WHERE table_schema='public' AND table_name = %s",
@@ -225,17 +434,19 @@ def table_exists(table_name):
 def sanitize_input(text, max_length=1000):
     if not text:
         return ""
-    import html
-    text = str(text).strip()
+    # Escaping never shortens text, so anything past max_length input chars is cut anyway;
+    # slice first so oversized payloads are not escaped in full
+    text = str(text).strip()[:max_length]
     # Basic HTML escaping
-    text = html.escape(text)
-    return text[:max_length]
+    return html.escape(text)[:max_length]
 
 # Validation Helpers
+EMAIL_RE = re.compile(r'^[\w\.-]+@[\w\.-]+\.\w+$')
+# Characters stripped from titles/names when building live room names
+NON_ALNUM_RE = re.compile(r'[^A-Za-z0-9]')
+
 def validate_email(email):
-    import re
-    pattern = r'^[\w\.-]+@[\w\.-]+\.\w+$'
-    return re.match(pattern, email) is not None
+    return EMAIL_RE.match(email) is not None
 
 def validate_password(password):
     if len(password) < 6:
@@ -278,27 +489,64 @@ def validate_quiz_data(data):
             
     return True, ""
 
+# Argon2id (OWASP baseline: 19 MiB, 2 passes). argon2-cffi releases the GIL while
+# hashing, so concurrent logins on gthread workers overlap instead of queueing;
+# memory is kept moderate because every worker thread may hash at once.
+password_hasher = PasswordHasher(time_cost=2, memory_cost=19456, parallelism=1)
+# Verified against when the email is unknown so a miss costs as much as a wrong password
+DUMMY_PASSWORD_HASH = password_hasher.hash(secrets.token_urlsafe(16))
+
 def hash_password(password):
-    # Use werkzeug's strong PBKDF2 hashing
-    return generate_password_hash(password)
+    return password_hasher.hash(password)
 
 
-def verify_password(stored_hash, password, user_id=None):
+def _rehash_password(user_id, password, email=None):
+    """Store a fresh Argon2id hash for a password that just verified against an older scheme."""
+    try:
+        db.execute_update('UPDATE users SET password_hash = ? WHERE id = ?', (hash_password(password), user_id))
+        # login_cache is keyed by email; without one, fall back to dropping every entry
+        if email:
+            login_cache.pop(email)
+        else:
+            login_cache.clear()
+        logger.info(f"Upgraded password hash for user {user_id} to Argon2id")
+    except Exception:
+        logger.exception('Failed to upgrade password hash')
+
+# Methods werkzeug's check_password_hash can verify
+WERKZEUG_HASH_PREFIXES = ('pbkdf2:', 'scrypt:')
+
+def verify_password(stored_hash, password, user_id=None, email=None):
     """Verify password against stored hash.
 
-    Supports legacy SHA-256 hex digests by auto-upgrading the hash to a secure PBKDF2 hash on successful login.
-    If `user_id` is provided and a legacy hash is detected and validated, the DB will be updated.
+    Accepts Argon2id hashes, werkzeug (PBKDF2/scrypt) hashes and legacy SHA-256 hex digests.
+    If `user_id` is provided and the password matched anything but current-parameter
+    Argon2id, the stored hash is upgraded in the background (and `email`'s login_cache
+    entry dropped).
     """
     if not stored_hash:
         return False
 
+    if stored_hash.startswith('$argon2'):
+        try:
+            password_hasher.verify(stored_hash, password)
+        except VerificationError:
+            return False
+        except InvalidHashError:
+            logger.error("[VERIFY] Malformed Argon2 hash for user %s", user_id)
+            return False
+        if user_id and password_hasher.check_needs_rehash(stored_hash):
+            background_executor.submit(_rehash_password, user_id, password, email)
+        return True
+
     try:
-        # If stored_hash looks like a werkzeug hash (contains ':' or starts with method) use check_password_hash
-        # werkzeug hashes have format: method:salt:hash or scrypt:iterations:blocksize:parallelization$salt$...
-        if ':' in stored_hash or stored_hash.startswith('$'):
-            logger.info(f"[VERIFY] Using werkzeug check_password_hash for hash type: {stored_hash[:20]}")
+        # werkzeug hashes have format: pbkdf2:sha256:iterations$salt$hash or scrypt:n:r:p$salt$hash
+        if stored_hash.startswith(WERKZEUG_HASH_PREFIXES):
+            logger.debug("[VERIFY] Using werkzeug check_password_hash for hash type: %s", stored_hash.split('$', 1)[0])
             result = check_password_hash(stored_hash, password)
-            logger.info(f"[VERIFY] werkzeug result: {result}")
+            logger.debug("[VERIFY] werkzeug result: %s", result)
+            if result and user_id:
+                background_executor.submit(_rehash_password, user_id, password, email)
             return result
     except Exception as e:
         logger.exception(f"[VERIFY] Exception in werkzeug check: {e}")
@@ -306,18 +554,15 @@ def verify_password(stored_hash, password, user_id=None):
         pass
 
     # Legacy SHA-256 hex digest: compare and upgrade if user_id provided
+    if len(stored_hash) != 64:
+        return False
     try:
-        import hashlib
-        legacy = hashlib.sha256(password.encode()).hexdigest()
-        if legacy == stored_hash:
-            # Optionally upgrade stored hash to werkzeug format
+        # Constant-time compare of the raw 32-byte digests (fromhex raises on non-hex rows)
+        legacy = hashlib.sha256(password.encode()).digest()
+        if hmac.compare_digest(legacy, bytes.fromhex(stored_hash)):
+            # Optionally upgrade stored hash to Argon2id (off the request thread)
             if user_id:
-                try:
-                    new_hash = generate_password_hash(password)
-                    db.execute_update('UPDATE users SET password_hash = ? WHERE id = ?', (new_hash, user_id))
-                    logger.info(f"Upgraded password hash for user {user_id} to PBKDF2")
-                except Exception:
-                    logger.exception('Failed to upgrade legacy password hash')
+                background_executor.submit(_rehash_password, user_id, password, email)
             return True
     except Exception:
         pass
@@ -340,49 +585,56 @@ app.register_blueprint(auth_bp)
 @teacher_required
 def teacher_dashboard():
     """Teacher dashboard page"""
-    # CRITICAL: Verify role to prevent role-leak bug
-    if session.get('role') != 'teacher':
-        logger.warning(f"Unauthorized access attempt to teacher dashboard by user {get_current_user_id()} with role {session.get('role')}")
-        session.clear()
-        return redirect(url_for('auth.login'))
-    
-    # Fetch teacher's classes
-    classes = db.execute_query(
-        '''SELECT c.*, 
-           (SELECT COUNT(*) FROM enrollments WHERE class_id = c.id) as student_count,
-           (SELECT COUNT(*) FROM lectures WHERE class_id = c.id) as lecture_count
+    # Role is enforced by @teacher_required
+    # Fetch teacher's classes; the counts only aggregate this teacher's classes
+    # (class_id index seeks), not every enrollment/lecture row in the table
+    teacher_id = get_current_user_id()
+    classes = dashboard_cache.get_or_set(('teacher', teacher_id), lambda: db.execute_query(
+        '''SELECT c.*,
+           COALESCE(e.cnt, 0) as student_count,
+           COALESCE(l.cnt, 0) as lecture_count
            FROM classes c
+           LEFT JOIN (SELECT class_id, COUNT(*) as cnt FROM enrollments
+                      WHERE class_id IN (SELECT id FROM classes WHERE teacher_id = ?)
+                      GROUP BY class_id) e ON e.class_id = c.id
+           LEFT JOIN (SELECT class_id, COUNT(*) as cnt FROM lectures
+                      WHERE class_id IN (SELECT id FROM classes WHERE teacher_id = ?)
+                      GROUP BY class_id) l ON l.class_id = c.id
            WHERE c.teacher_id = ?
            ORDER BY c.created_at DESC''',
-        (get_current_user_id(),)
-    )
+        (teacher_id, teacher_id, teacher_id)
+    ))
     return render_template('teacher_dashboard.html', classes=classes)
 
 @app.route('/student/dashboard')
 @login_required
 def student_dashboard():
     """Student dashboard page"""
+    user_id = get_current_user_id()
     # CRITICAL: Verify role to prevent role-leak bug
     if session.get('role') == 'teacher':
-        logger.warning(f"Teacher {get_current_user_id()} attempted to access student dashboard")
+        logger.warning(f"Teacher {user_id} attempted to access student dashboard")
         return redirect(url_for('teacher_dashboard'))
     
     # Fetch student's enrolled classes
-    classes = db.execute_query(
-        '''SELECT c.*, u.name as teacher_name,
+    classes = dashboard_cache.get_or_set(('student', user_id), lambda: db.execute_query(
+        '''WITH prog AS (
+               SELECT q.class_id, AVG(qs.score * 100.0 / qs.total) as avg_pct
+               FROM quiz_submissions qs
+               JOIN quizzes q ON qs.quiz_id = q.id
+               WHERE qs.student_id = ?
+               GROUP BY q.class_id)
+           SELECT c.*, u.name as teacher_name,
            e.enrolled_at,
-           COALESCE(
-               (SELECT AVG(score * 100.0 / total) FROM quiz_submissions qs 
-                JOIN quizzes q ON qs.quiz_id = q.id 
-                WHERE q.class_id = c.id AND qs.student_id = ?), 0
-           ) as progress
-           FROM classes c
-           JOIN enrollments e ON c.id = e.class_id
+           COALESCE(p.avg_pct, 0) as progress
+           FROM enrollments e
+           JOIN classes c ON c.id = e.class_id
            JOIN users u ON c.teacher_id = u.id
+           LEFT JOIN prog p ON p.class_id = c.id
            WHERE e.student_id = ?
            ORDER BY e.enrolled_at DESC''',
-        (get_current_user_id(), get_current_user_id())
-    )
+        (user_id, user_id)
+    ))
     return render_template('student_dashboard.html', classes=classes)
 
 # ============================================================================
@@ -394,14 +646,18 @@ def student_dashboard():
 @api_teacher_required
 def get_teacher_classes():
     """Get all classes for logged-in teacher"""
-    classes = db.execute_query(
-        '''SELECT c.*, 
-           (SELECT COUNT(*) FROM enrollments WHERE class_id = c.id) as student_count
+    teacher_id = get_current_user_id()
+    classes = listing_cache.get_or_set(('teacher_classes', teacher_id), lambda: db.execute_query(
+        '''SELECT c.*,
+           COALESCE(e.cnt, 0) as student_count
            FROM classes c
+           LEFT JOIN (SELECT class_id, COUNT(*) as cnt FROM enrollments
+                      WHERE class_id IN (SELECT id FROM classes WHERE teacher_id = ?)
+                      GROUP BY class_id) e ON e.class_id = c.id
            WHERE c.teacher_id = ?
            ORDER BY c.created_at DESC''',
-        (get_current_user_id(),)
-    )
+        (teacher_id, teacher_id)
+    ))
     return jsonify(classes)
 
 @app.route('/api/create_class', methods=['POST'])
@@ -409,6 +665,7 @@ def get_teacher_classes():
 @api_teacher_required
 def create_class():
     """Create a new class"""
+    user_id = get_current_user_id()
     try:
         data = request.get_json(silent=True)
         if not data:
@@ -429,14 +686,18 @@ def create_class():
 
         class_id = db.execute_insert(
             'INSERT INTO classes (title, description, teacher_id, code) VALUES (?, ?, ?, ?)',
-            (title, description, get_current_user_id(), class_code)
+            (title, description, user_id, class_code)
         )
         
+        listing_cache.pop_prefix('browse')
+        listing_cache.pop_prefix('available')
+        listing_cache.pop(('teacher_classes', user_id))
+        dashboard_cache.pop(('teacher', user_id))
         logger.info(f"Class created: {title} (ID: {class_id})")
         return json_success('Class created', data={'class_id': class_id, 'code': class_code}, status=201, class_id=class_id)
-    except Exception as e:
-        logger.error(f"Error creating class: {e}")
-        return json_error(f'Failed to create class: {str(e)}', status=500)
+    except Exception:
+        logger.exception("Error creating class")
+        return json_error('Failed to create class', status=500)
 
 @app.route('/api/student/classes')
 @api_login_required
@@ -459,23 +720,27 @@ def get_student_classes():
 @api_login_required
 def get_user_data():
     """Get user data with enrolled classes for student dashboard"""
+    user_id = get_current_user_id()
     # Get user information
-    user = db.execute_one('SELECT name, email FROM users WHERE id = ?', (get_current_user_id(),))
+    user = db.execute_one('SELECT name, email FROM users WHERE id = ?', (user_id,))
     
     if session.get('role') == 'student':
         classes = db.execute_query(
-            '''SELECT c.*, u.name as teacher,
-               COALESCE(
-                   (SELECT AVG(score * 100.0 / total) FROM quiz_submissions qs 
-                    JOIN quizzes q ON qs.quiz_id = q.id 
-                    WHERE q.class_id = c.id AND qs.student_id = ?), 0
-               ) as progress
-               FROM classes c
-               JOIN enrollments e ON c.id = e.class_id
+            '''WITH prog AS (
+                   SELECT q.class_id, AVG(qs.score * 100.0 / qs.total) as avg_pct
+                   FROM quiz_submissions qs
+                   JOIN quizzes q ON qs.quiz_id = q.id
+                   WHERE qs.student_id = ?
+                   GROUP BY q.class_id)
+               SELECT c.*, u.name as teacher,
+               COALESCE(p.avg_pct, 0) as progress
+               FROM enrollments e
+               JOIN classes c ON c.id = e.class_id
                JOIN users u ON c.teacher_id = u.id
+               LEFT JOIN prog p ON p.class_id = c.id
                WHERE e.student_id = ?
                ORDER BY e.enrolled_at DESC''',
-            (get_current_user_id(), get_current_user_id())
+            (user_id, user_id)
         )
         return jsonify({
             'classes': classes,
@@ -494,13 +759,14 @@ def get_user_data():
 @api_login_required
 def browse_classes():
     """Get all available classes for browsing"""
-    classes = db.execute_query(
+    classes = listing_cache.get_or_set(('browse',), lambda: db.execute_query(
         '''SELECT c.*, u.name as teacher, u.name as instructor,
-           (SELECT COUNT(*) FROM enrollments WHERE class_id = c.id) as student_count
+           COALESCE(e.cnt, 0) as student_count
            FROM classes c
            JOIN users u ON c.teacher_id = u.id
+           LEFT JOIN (SELECT class_id, COUNT(*) as cnt FROM enrollments GROUP BY class_id) e ON e.class_id = c.id
            ORDER BY c.created_at DESC''',
-    )
+    ))
     return jsonify(classes)
 
 @app.route('/api/teacher/students')
@@ -508,7 +774,8 @@ def browse_classes():
 @api_teacher_required
 def get_teacher_students():
     """Get all students enrolled in teacher's classes"""
-    students = db.execute_query(
+    user_id = get_current_user_id()
+    students = db.iter_query(
         '''SELECT DISTINCT u.id, u.name, u.email,
            (SELECT COUNT(*) FROM quiz_submissions qs 
             JOIN quizzes q ON qs.quiz_id = q.id 
@@ -519,9 +786,9 @@ def get_teacher_students():
            JOIN classes c ON e.class_id = c.id
            WHERE c.teacher_id = ?
            ORDER BY u.name''',
-        (get_current_user_id(), get_current_user_id())
+        (user_id, user_id)
     )
-    return jsonify(students)
+    return json_stream(students)
 
 
 @app.route('/api/teacher/alerts')
@@ -580,9 +847,14 @@ def get_teacher_alerts():
 def get_teacher_feedback():
     """Get learner feedback entries for teacher dashboard."""
     teacher_id = get_current_user_id()
+    feedback = analytics_cache.get_or_set(('feedback', teacher_id), lambda: _load_teacher_feedback(teacher_id))
+    return json_success(message='Feedback loaded', data={'feedback': feedback}, feedback=feedback)
+
 
+def _load_teacher_feedback(teacher_id):
+    """Fetch feedback rows for a teacher, synthesizing them from submissions if needed."""
     if table_exists('feedback'):
-        feedback_items = db.execute_query(
+        return db.execute_query(
             '''SELECT f.id, f.rating, f.message, f.created_at, u.name as student_name
                FROM feedback f
                JOIN users u ON f.user_id = u.id
@@ -594,7 +866,6 @@ def get_teacher_feedback():
                LIMIT 50''',
             (teacher_id,)
         )
-        return json_success(message='Feedback loaded', data={'feedback': feedback_items}, feedback=feedback_items)
 
     # Fallback: synthesize from recent submissions so tab has meaningful data
     feedback_items = db.execute_query(
@@ -617,7 +888,7 @@ def get_teacher_feedback():
         'created_at': row['created_at'],
         'student_name': row['student_name']
     } for idx, row in enumerate(feedback_items, start=1)]
-    return json_success(message='Feedback loaded', data={'feedback': normalized}, feedback=normalized)
+    return normalized
 
 @app.route('/api/student/analytics')
 @api_login_required
@@ -804,24 +1075,30 @@ def get_global_leaderboard():
 @app.route('/api/teacher/analytics')
 @api_login_required
 @api_teacher_required
+@conditional
 def get_teacher_analytics():
     """Get overview analytics for all teacher's classes"""
     try:
         teacher_id = get_current_user_id()
         logger.info(f"Fetching analytics for teacher {teacher_id}")
         
-        # Get all classes with basic stats
+        # Get all classes with basic stats; the aggregates only cover this teacher's classes
         classes = db.execute_query(
             '''SELECT c.id as class_id, c.title as class_name,
-               (SELECT COUNT(*) FROM enrollments WHERE class_id = c.id) as total_students,
-               COALESCE((SELECT AVG(qs.score) 
-                FROM quiz_submissions qs 
-                JOIN quizzes q ON qs.quiz_id = q.id 
-                WHERE q.class_id = c.id), 0) as avg_class_score
+               COALESCE(e.cnt, 0) as total_students,
+               COALESCE(s.avg_score, 0) as avg_class_score
                FROM classes c
+               LEFT JOIN (SELECT class_id, COUNT(*) as cnt FROM enrollments
+                          WHERE class_id IN (SELECT id FROM classes WHERE teacher_id = ?)
+                          GROUP BY class_id) e ON e.class_id = c.id
+               LEFT JOIN (SELECT q.class_id, AVG(qs.score) as avg_score
+                          FROM quiz_submissions qs
+                          JOIN quizzes q ON qs.quiz_id = q.id
+                          WHERE q.class_id IN (SELECT id FROM classes WHERE teacher_id = ?)
+                          GROUP BY q.class_id) s ON s.class_id = c.id
                WHERE c.teacher_id = ?
                ORDER BY c.created_at DESC''',
-            (teacher_id,)
+            (teacher_id, teacher_id, teacher_id)
         )
         
         return jsonify({
@@ -845,54 +1122,32 @@ def get_class_stats(class_id):
     try:
         teacher_id = get_current_user_id()
         
-        # Verify teacher owns this class
-        class_check = db.execute_one(
-            'SELECT id FROM classes WHERE id = ? AND teacher_id = ?',
+        # Ownership check and the headline counts in one round trip (no row → not the owner)
+        stats = db.execute_one(
+            '''SELECT
+                (SELECT COUNT(*) FROM enrollments WHERE class_id = c.id) as total_students,
+                (SELECT COUNT(*) FROM quizzes WHERE class_id = c.id) as total_quizzes,
+                COUNT(qs.id) as completed_submissions,
+                COALESCE(AVG(qs.score), 0) as avg_score,
+                COUNT(DISTINCT qs.student_id) FILTER (WHERE DATE(qs.submitted_at) = DATE('now')) as active_today
+               FROM classes c
+               LEFT JOIN quizzes q ON q.class_id = c.id
+               LEFT JOIN quiz_submissions qs ON qs.quiz_id = q.id
+               WHERE c.id = ? AND c.teacher_id = ?
+               GROUP BY c.id''',
             (class_id, teacher_id)
         )
         
-        if not class_check:
+        if not stats:
             return jsonify({'error': 'Unauthorized'}), 403
         
         logger.info(f"Fetching stats for class {class_id}")
         
-        # Total students
-        total_students = db.execute_one(
-            'SELECT COUNT(*) as count FROM enrollments WHERE class_id = ?',
-            (class_id,)
-        )['count']
-        
-        # Active students today
-        active_today = db.execute_one(
-            '''SELECT COUNT(DISTINCT qs.student_id) as count
-               FROM quiz_submissions qs
-               JOIN quizzes q ON qs.quiz_id = q.id
-               WHERE q.class_id = ? AND DATE(qs.submitted_at) = DATE('now')''',
-            (class_id,)
-        )['count']
-        
-        # Average class score
-        avg_score_result = db.execute_one(
-            '''SELECT COALESCE(AVG(qs.score), 0) as avg_score
-               FROM quiz_submissions qs
-               JOIN quizzes q ON qs.quiz_id = q.id
-               WHERE q.class_id = ?''',
-            (class_id,)
-        )
-        avg_class_score = round(avg_score_result['avg_score'] if avg_score_result else 0)
-        
-        # Quiz completion rate
-        total_quizzes = db.execute_one(
-            'SELECT COUNT(*) as count FROM quizzes WHERE class_id = ?',
-            (class_id,)
-        )['count']
-        
-        completed_submissions = db.execute_one(
-            '''SELECT COUNT(*) as count FROM quiz_submissions qs
-               JOIN quizzes q ON qs.quiz_id = q.id
-               WHERE q.class_id = ?''',
-            (class_id,)
-        )['count']
+        total_students = stats['total_students']
+        active_today = stats['active_today']
+        avg_class_score = round(stats['avg_score'])
+        total_quizzes = stats['total_quizzes']
+        completed_submissions = stats['completed_submissions']
         
         total_possible = total_quizzes * total_students if total_students > 0 else 1
         completion_rate = round((completed_submissions / total_possible) * 100) if total_possible > 0 else 0
@@ -1002,10 +1257,28 @@ def get_class_stats(class_id):
         return jsonify({'error': 'Failed to load class stats'}), 500
 
 
+@app.route('/api/teacher/class/<int:class_id>/recompute-metrics', methods=['POST'])
+@api_login_required
+@api_teacher_required
+def recompute_class_metrics(class_id):
+    """Rebuild student_metrics for every student in a class"""
+    class_check = db.execute_one(
+        'SELECT id FROM classes WHERE id = ? AND teacher_id = ?',
+        (class_id, get_current_user_id())
+    )
+    if not class_check:
+        return jsonify({'error': 'Unauthorized'}), 403
+
+    updated = adaptive.recompute_class_metrics(class_id)
+    analytics_cache.clear()
+    return json_success('Class metrics recomputed', students_updated=updated)
+
+
 @app.route('/api/join_class', methods=['POST'])
 @api_login_required
 def join_class():
     """Enroll student in a class using code"""
+    user_id = get_current_user_id()
     data = get_json_payload()
     if data is None:
         return json_error('Invalid JSON payload', status=400)
@@ -1016,7 +1289,7 @@ def join_class():
         return json_error('Class Code is required', status=400)
 
     # Find class by code
-    class_info = db.execute_one('SELECT id, title FROM classes WHERE code = ?', (code,))
+    class_info = db.execute_one('SELECT id, title, teacher_id FROM classes WHERE code = ?', (code,))
     
     if not class_info:
         return json_error('Invalid Class Code', status=404)
@@ -1025,8 +1298,8 @@ def join_class():
     
     # Check if already enrolled
     existing = db.execute_one(
-        'SELECT id FROM enrollments WHERE student_id = ? AND class_id = ?',
-        (get_current_user_id(), class_id)
+        SQL_ENROLLMENT_CHECK,
+        (user_id, class_id)
     )
     
     if existing:
@@ -1034,16 +1307,22 @@ def join_class():
     
     db.execute_insert(
         'INSERT INTO enrollments (student_id, class_id) VALUES (?, ?)',
-        (get_current_user_id(), class_id)
+        (user_id, class_id)
     )
     
-    logger.info(f"Student {get_current_user_id()} enrolled in class {class_id} via code {code}")
+    listing_cache.pop(('browse',))
+    listing_cache.pop(('available', user_id))
+    listing_cache.pop_prefix('teacher_classes')
+    dashboard_cache.pop(('student', user_id))
+    dashboard_cache.pop(('teacher', class_info['teacher_id']))
+    logger.info(f"Student {user_id} enrolled in class {class_id} via code {code}")
     return json_success(f"Successfully joined {class_info['title']}", status=201)
 
 @app.route('/api/leave_class', methods=['POST'])
 @api_login_required
 def leave_class():
     """Unenroll student from a class"""
+    user_id = get_current_user_id()
     data = get_json_payload()
     class_id = data.get('class_id')
     
@@ -1057,8 +1336,8 @@ def leave_class():
 
     # Verify enrollment exists
     existing = db.execute_one(
-        'SELECT id FROM enrollments WHERE student_id = ? AND class_id = ?',
-        (get_current_user_id(), class_id)
+        SQL_ENROLLMENT_CHECK,
+        (user_id, class_id)
     )
     
     if not existing:
@@ -1067,10 +1346,15 @@ def leave_class():
     # Allow leaving
     db.execute_update(
         'DELETE FROM enrollments WHERE student_id = ? AND class_id = ?',
-        (get_current_user_id(), class_id)
+        (user_id, class_id)
     )
     
-    logger.info(f"Student {get_current_user_id()} left class {class_id}")
+    listing_cache.pop(('browse',))
+    listing_cache.pop(('available', user_id))
+    listing_cache.pop_prefix('teacher_classes')
+    dashboard_cache.pop(('student', user_id))
+    dashboard_cache.pop_prefix('teacher')
+    logger.info(f"Student {user_id} left class {class_id}")
     return json_success('Successfully left the class')
 
 @app.route('/api/student/recommendations/legacy')
@@ -1111,59 +1395,36 @@ def get_knowledge_gaps_legacy():
 @login_required
 def class_view(class_id):
     """Class view page"""
-    # Get class details with teacher name
+    user_id = get_current_user_id()
+    # Class details, teacher name, enrollment and the student's rating in one round trip
     class_info = db.execute_one('''
-        SELECT c.*, u.name as teacher_name 
+        SELECT c.*, u.name as teacher_name,
+               EXISTS(SELECT 1 FROM enrollments WHERE class_id = c.id AND student_id = ?) as is_enrolled,
+               (SELECT rating FROM student_metrics WHERE user_id = ? AND class_id = c.id) as student_rating
         FROM classes c 
         JOIN users u ON c.teacher_id = u.id 
         WHERE c.id = ?
-    ''', (class_id,))
+    ''', (user_id, user_id, class_id))
     
     if not class_info:
         return "Class not found", 404
     
     # Check access
-    if session['role'] == 'student':
-        enrollment = db.execute_one(
-            'SELECT id FROM enrollments WHERE student_id = ? AND class_id = ?',
-            (get_current_user_id(), class_id)
-        )
-        if not enrollment:
+    is_student = session['role'] == 'student'
+    if is_student:
+        if not class_info['is_enrolled']:
             return "Access denied", 403
-    elif class_info['teacher_id'] != get_current_user_id():
+    elif class_info['teacher_id'] != user_id:
         return "Access denied", 403
     
-    # Get lectures
-    lectures = db.execute_query(
-        'SELECT * FROM lectures WHERE class_id = ? ORDER BY uploaded_at DESC',
-        (class_id,)
-    )
-    
-    # Get quizzes
-    quizzes = db.execute_query(
-        '''SELECT q.*, 
-           (SELECT COUNT(*) FROM quiz_questions WHERE quiz_id = q.id) as question_count
-           FROM quizzes q
-           WHERE q.class_id = ?
-           ORDER BY q.created_at DESC''',
-        (class_id,)
-    )
-    
-    # Check for active live session
-    active_session = db.execute_one(
-        'SELECT * FROM live_sessions WHERE class_id = ? AND is_active = 1',
-        (class_id,)
-    )
+    # Lectures / quizzes share the listing cache with the class API endpoints, so repeat
+    # views are served from memory on the request's own connection
+    lectures = _load_class_lectures(class_id)
+    quizzes = _load_class_quizzes(class_id)
+    active_session = get_active_live_session(class_id)
     
     # Get progress for student
-    if session['role'] == 'student':
-        progress_data = db.execute_one(
-            'SELECT * FROM student_metrics WHERE user_id = ? AND class_id = ?',
-            (get_current_user_id(), class_id)
-        )
-        progress = progress_data['rating'] if progress_data else 0
-    else:
-        progress = 0
+    progress = (class_info['student_rating'] or 0) if is_student else 0
     
     return render_template('class_view.html', 
                          class_id=class_id, 
@@ -1199,7 +1460,7 @@ def generate_adaptive_quiz():
 
     # Verify enrollment
     enrollment = db.execute_one(
-        'SELECT id FROM enrollments WHERE student_id = ? AND class_id = ?',
+        SQL_ENROLLMENT_CHECK,
         (student_id, class_id)
     )
     if not enrollment:
@@ -1225,37 +1486,29 @@ def generate_adaptive_quiz():
 @login_required
 def get_class_data(class_id):
     """Get class details API"""
-    class_info = db.execute_one('SELECT * FROM classes WHERE id = ?', (class_id,))
+    user_id = get_current_user_id()
+    # Class row, teacher name, student count and the caller's enrollment in one round trip
+    result = db.execute_one('''
+        SELECT c.*, u.name as teacher_name,
+               (SELECT COUNT(*) FROM enrollments WHERE class_id = c.id) as student_count,
+               EXISTS(SELECT 1 FROM enrollments WHERE class_id = c.id AND student_id = ?) as is_enrolled
+        FROM classes c
+        LEFT JOIN users u ON c.teacher_id = u.id
+        WHERE c.id = ?
+    ''', (user_id, class_id))
     
-    if not class_info:
+    if not result:
         return jsonify({'error': 'Class not found'}), 404
     
     # Check access
+    is_enrolled = result.pop('is_enrolled')
     if session['role'] == 'student':
-        enrollment = db.execute_one(
-            'SELECT id FROM enrollments WHERE student_id = ? AND class_id = ?',
-            (get_current_user_id(), class_id)
-        )
-        if not enrollment:
+        if not is_enrolled:
             return jsonify({'error': 'Access denied'}), 403
-    elif class_info['teacher_id'] != get_current_user_id():
+    elif result['teacher_id'] != user_id:
         return jsonify({'error': 'Access denied'}), 403
     
-    # Get student count
-    student_count = db.execute_one(
-        'SELECT COUNT(*) as count FROM enrollments WHERE class_id = ?',
-        (class_id,)
-    )['count']
-    
-    # Get teacher info
-    teacher = db.execute_one(
-        'SELECT name FROM users WHERE id = ?',
-        (class_info['teacher_id'],)
-    )
-    
-    result = dict(class_info)
-    result['student_count'] = student_count
-    result['teacher_name'] = teacher['name'] if teacher else 'Unknown'
+    result['teacher_name'] = result['teacher_name'] or 'Unknown'
     
     return jsonify(result)
 
@@ -1267,7 +1520,6 @@ def get_class_data(class_id):
 @login_required
 def protected_static_uploads(filename):
     """Securely serve uploaded files only to authenticated users"""
-    from flask import send_from_directory
     return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
 
 
@@ -1299,14 +1551,16 @@ def upload_lecture():
             
             filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
             
-            # Save file
+            # Save file in 1 MB chunks, counting the size as we go
+            file_size = 0
             try:
-                file.save(filepath)
-            except Exception as e:
-                logger.error(f"File save failed: {e}")
-                return json_error(f"Failed to save file: {str(e)}", status=500)
-            
-            file_size = os.path.getsize(filepath)
+                with open(filepath, 'wb') as out:
+                    while chunk := file.stream.read(1 << 20):
+                        out.write(chunk)
+                        file_size += len(chunk)
+            except Exception:
+                logger.exception("File save failed")
+                return json_error("Failed to save file", status=500)
             
             # DB Insert
             try:
@@ -1314,44 +1568,44 @@ def upload_lecture():
                     'INSERT INTO lectures (class_id, filename, filepath, file_size) VALUES (?, ?, ?, ?)',
                     (class_id, filename, filepath, file_size)
                 )
+                listing_cache.pop(('lectures', int(class_id)))
+                dashboard_cache.pop(('teacher', get_current_user_id()))
                 logger.info(f"Lecture uploaded: {filename} (ID: {lecture_id}, Class: {class_id})")
                 return jsonify({
                     'success': True, 
                     'message': 'Lecture uploaded successfully', 
                     'data': {'filename': filename, 'id': lecture_id}
                 }), 201
-            except Exception as e:
+            except Exception:
                 # If DB fails, try to delete the uploaded file to avoid orphans
                 try:
                     os.remove(filepath)
                 except:
                     pass
-                logger.error(f"Database insert failed: {e}")
-                import traceback
-                traceback.print_exc()
-                return json_error(f"Database error: {str(e)}", status=500)
+                logger.exception("Database insert failed")
+                return json_error("Database error", status=500)
 
         return json_error('Invalid request data', status=400)
         
-    except Exception as e:
+    except Exception:
         logger.exception("Unexpected error in upload_lecture")
-        import traceback
-        traceback.print_exc()
         return jsonify({
             'success': False,
             'message': 'Internal Server Error',
-            'error': str(e)
+            'error': 'Internal Server Error'
         }), 500
 
 @app.route('/api/class/<int:class_id>/lectures')
 @login_required
 def get_class_lectures(class_id):
     """Get all lectures for a class"""
-    lectures = db.execute_query(
+    return jsonify(_load_class_lectures(class_id))
+
+def _load_class_lectures(class_id):
+    return listing_cache.get_or_set(('lectures', class_id), lambda: db.execute_query(
         'SELECT * FROM lectures WHERE class_id = ? ORDER BY uploaded_at DESC',
         (class_id,)
-    )
-    return jsonify(lectures)
+    ))
 
 @app.route('/api/create_quiz', methods=['POST'])
 @login_required
@@ -1378,14 +1632,13 @@ def create_quiz():
         (class_id, title, description)
     )
     
-    # Add questions
-    with db.get_db() as conn:
-        for q in questions:
-            conn.execute(
-                'INSERT INTO quiz_questions (quiz_id, question_text, options, correct_option_index, explanation) VALUES (?, ?, ?, ?, ?)',
-                (quiz_id, q['question'], json.dumps(q['options']), q['correct'], q.get('explanation', ''))
-            )
+    # Add questions (one batched statement, one transaction)
+    db.execute_many(
+        'INSERT INTO quiz_questions (quiz_id, question_text, options, correct_option_index, explanation) VALUES (?, ?, ?, ?, ?)',
+        [(quiz_id, q['question'], orjson.dumps(q['options']).decode(), q['correct'], q.get('explanation', '')) for q in questions]
+    )
     
+    listing_cache.pop(('quizzes', int(class_id)))
     logger.info(f"Quiz created: {title} (ID: {quiz_id}, Questions: {len(questions)})")
     return json_success('Quiz created', data={'quiz_id': quiz_id}, status=201, quiz_id=quiz_id)
 
@@ -1393,38 +1646,29 @@ def create_quiz():
 @api_login_required
 def get_class_quizzes(class_id):
     """Get all quizzes for a class"""
-    quizzes = db.execute_query(
-        '''SELECT q.*, 
-           (SELECT COUNT(*) FROM quiz_questions WHERE quiz_id = q.id) as question_count
+    return jsonify(_load_class_quizzes(class_id))
+
+def _load_class_quizzes(class_id):
+    return listing_cache.get_or_set(('quizzes', class_id), lambda: db.execute_query(
+        '''SELECT q.*,
+           COALESCE(qq.cnt, 0) as question_count
            FROM quizzes q
+           LEFT JOIN (SELECT quiz_id, COUNT(*) as cnt FROM quiz_questions
+                      WHERE quiz_id IN (SELECT id FROM quizzes WHERE class_id = ?)
+                      GROUP BY quiz_id) qq ON qq.quiz_id = q.id
            WHERE q.class_id = ?
            ORDER BY q.created_at DESC''',
-        (class_id,)
-    )
-    return jsonify(quizzes)
-
-@app.route('/quiz/<int:quiz_id>')
-@login_required
-def quiz_page(quiz_id):
-    """Render the quiz-taking page."""
-    quiz = db.execute_one('SELECT * FROM quizzes WHERE id = ?', (quiz_id,))
-    if not quiz:
-        return 'Quiz not found', 404
-    return render_template('quiz_view.html', quiz_id=quiz_id)
+        (class_id, class_id)
+    ))
 
 @app.route('/api/quiz/<int:quiz_id>')
 @api_login_required
 def get_quiz(quiz_id):
     """Get quiz details with questions"""
-    quiz = db.execute_one('SELECT * FROM quizzes WHERE id = ?', (quiz_id,))
+    quiz = db.execute_one(SQL_QUIZ_BY_ID, (quiz_id,))
     if not quiz:
         return jsonify({'success': False, 'error': 'Quiz not found', 'message': 'Quiz not found'}), 404
     
-    questions = db.execute_query(
-        'SELECT id, question_text, options, explanation FROM quiz_questions WHERE quiz_id = ?',
-        (quiz_id,)
-    )
-    
     quiz_data = dict(quiz)
     
     # Check attempts
@@ -1460,7 +1704,7 @@ def get_quiz(quiz_id):
     quiz_data['questions'] = questions
     for q in quiz_data['questions']:
         try:
-            q['options'] = json.loads(q.get('options') or '[]')
+            q['options'] = orjson.loads(q.get('options') or '[]')
         except Exception:
             q['options'] = []
         # SECURITY: Strip explanation until attempt 3+
@@ -1481,286 +1725,287 @@ def submit_quiz():
     return _handle_quiz_submission(data, get_current_user_id())
 
 
+def _refresh_after_submission(user_id, quiz_id, class_id, score, total):
+    """Derived per-student state a submission feeds; runs on background_executor."""
+    # Update adaptive quiz profile
+    try:
+        adaptive_quiz.update_adaptive_profile(user_id, class_id, score, total)
+    except Exception as e:
+        logger.error(f"Adaptive profile update failed: {e}")
+
+    # Update skill tree progress
+    try:
+        skill_tree.update_progress_after_quiz(user_id, quiz_id, class_id, score, total)
+    except Exception as e:
+        logger.error(f"Skill tree progress update failed: {e}")
+
+    # Regenerate exam prediction
+    try:
+        exam_predictor.generate_prediction(user_id)
+    except Exception as e:
+        logger.error(f"Exam prediction update failed: {e}")
+
+    # Recalculate class leaderboard
+    try:
+        leaderboard_engine.recalculate_class(class_id)
+    except Exception as e:
+        logger.error(f"Leaderboard recalculation failed: {e}")
+
+
 def _handle_quiz_submission(data, user_id):
     """Shared handler for quiz submission logic. Returns (Response, status)."""
-    try:
-        logger.info("[SUBMIT_QUIZ] Starting submission for user %s", user_id)
+    logger.info("[SUBMIT_QUIZ] Starting submission for user %s", user_id)
 
-        if session.get('role') != 'student':
-            return json_error('Only students can submit quizzes', status=403)
+    if session.get('role') != 'student':
+        return json_error('Only students can submit quizzes', status=403)
 
-        quiz_id = data.get('quiz_id')
-        answers = data.get('answers', {}) or {}
-        duration = data.get('duration', 0)
+    quiz_id = data.get('quiz_id')
+    answers = data.get('answers', {}) or {}
+    duration = data.get('duration', 0)
 
-        if not quiz_id:
-            return json_error('Quiz ID required', status=400)
+    if not quiz_id:
+        return json_error('Quiz ID required', status=400)
 
-        try:
-            quiz_id = int(quiz_id)
-        except (TypeError, ValueError):
-            return json_error('Invalid quiz_id', status=400)
+    try:
+        quiz_id = int(quiz_id)
+    except (TypeError, ValueError):
+        return json_error('Invalid quiz_id', status=400)
 
-        if not isinstance(answers, dict):
-            return json_error('Invalid answers payload', status=400)
+    if not isinstance(answers, dict):
+        return json_error('Invalid answers payload', status=400)
 
-        try:
-            duration = int(duration or 0)
-            if duration < 0:
-                duration = 0
-        except (TypeError, ValueError):
+    try:
+        duration = int(duration or 0)
+        if duration < 0:
             duration = 0
+    except (TypeError, ValueError):
+        duration = 0
 
-        quiz = db.execute_one('SELECT id, class_id FROM quizzes WHERE id = ?', (quiz_id,))
-        if not quiz:
-            return json_error('Quiz not found', status=404)
+    quiz = db.execute_one('SELECT id, class_id FROM quizzes WHERE id = ?', (quiz_id,))
+    if not quiz:
+        return json_error('Quiz not found', status=404)
 
-        # Verify enrollment for students
-        enrollment = db.execute_one(
-            'SELECT id FROM enrollments WHERE student_id = ? AND class_id = ?',
-            (user_id, quiz['class_id'])
-        )
-        if not enrollment:
-            return json_error('You are not enrolled in this class', status=403)
+    # Verify enrollment for students
+    enrollment = db.execute_one(
+        SQL_ENROLLMENT_CHECK,
+        (user_id, quiz['class_id'])
+    )
+    if not enrollment:
+        return json_error('You are not enrolled in this class', status=403)
 
-        # Check attempt count
-        attempts_count = db.execute_one(
-            'SELECT COUNT(*) as count FROM quiz_submissions WHERE quiz_id = ? AND student_id = ?',
-            (quiz_id, user_id)
-        )['count']
+    # Check attempt count
+    attempts_count = db.execute_one(
+        'SELECT COUNT(*) as count FROM quiz_submissions WHERE quiz_id = ? AND student_id = ?',
+        (quiz_id, user_id)
+    )['count']
 
-        if attempts_count >= 3:
-            # Use the latest submission for display
-            latest = db.execute_one(
-                'SELECT score, total FROM quiz_submissions WHERE quiz_id = ? AND student_id = ? ORDER BY submitted_at DESC LIMIT 1',
-                (quiz_id, user_id)
-            )
-            percentage = round((latest['score'] / latest['total']) * 100, 1) if latest['total'] > 0 else 0
+    if attempts_count >= 3:
+        # Use the latest submission for display
+        latest = db.execute_one(
+            'SELECT score, total FROM quiz_submissions WHERE quiz_id = ? AND student_id = ? ORDER BY submitted_at DESC LIMIT 1',
+            (quiz_id, user_id)
+        )
+        percentage = round((latest['score'] / latest['total']) * 100, 1) if latest['total'] > 0 else 0
             
-            return json_success(
-                message='Maximum attempts (3) reached',
-                data={
-                    'score': latest['score'],
-                    'total': latest['total'],
-                    'percentage': percentage,
-                    'attempt_number': attempts_count,
-                    'is_limit_reached': True
-                },
-                score=latest['score'],
-                total=latest['total'],
-                percentage=percentage,
-                attempt_number=attempts_count,
-                is_limit_reached=True
-            )
-
-        # Get correct answers and text for feedback
-        questions = db.execute_query(
-            'SELECT id, question_text, correct_option_index, options FROM quiz_questions WHERE quiz_id = ?',
-            (quiz_id,)
+        return json_success(
+            message='Maximum attempts (3) reached',
+            data={
+                'score': latest['score'],
+                'total': latest['total'],
+                'percentage': percentage,
+                'attempt_number': attempts_count,
+                'is_limit_reached': True
+            },
+            score=latest['score'],
+            total=latest['total'],
+            percentage=percentage,
+            attempt_number=attempts_count,
+            is_limit_reached=True
         )
 
-        if not questions:
-            return json_error('Quiz has no questions', status=400)
+    # Get correct answers and text for feedback
+    questions = db.execute_query(
+        'SELECT id, question_text, correct_option_index, options FROM quiz_questions WHERE quiz_id = ?',
+        (quiz_id,)
+    )
+
+    if not questions:
+        return json_error('Quiz has no questions', status=400)
 
-        question_map = {}
-        detailed_results = []
+    question_map = {}
+    detailed_results = []
         
-        for q in questions:
-            qid = str(q['id'])
-            try:
-                opts = json.loads(q.get('options') or '[]')
-            except Exception:
-                opts = []
+    for q in questions:
+        qid = str(q['id'])
+        try:
+            opts = orjson.loads(q.get('options') or '[]')
+        except Exception:
+            opts = []
             
-            question_map[qid] = {
-                'text': q['question_text'],
-                'correct': q['correct_option_index'],
-                'options': opts,
-                'option_count': len(opts)
-            }
-
-        expected_keys = set(question_map.keys())
-        answer_keys = set(str(k) for k in answers.keys())
-
-        if expected_keys != answer_keys:
-            return json_error(f'Answers must include every question exactly once. Missing: {list(expected_keys - answer_keys)}, Extra: {list(answer_keys - expected_keys)}', status=400)
-
-        normalized_answers = {}
-        for qid, submitted in answers.items():
-            sqid = str(qid)
-            if sqid not in question_map:
-                return json_error(f'Invalid question id: {sqid}', status=400)
-            try:
-                selected = int(submitted)
-            except (TypeError, ValueError):
-                return json_error(f'Invalid answer for question {sqid}', status=400)
-            option_count = question_map[sqid]['option_count']
-            if selected < 0 or (option_count and selected >= option_count):
-                return json_error(f'Answer out of range for question {sqid}', status=400)
-            normalized_answers[sqid] = selected
-
-        # Calculate score and build details
-        score = 0
-        total = len(questions)
-        logger.info(f"[SCORE_DEBUG] Quiz {quiz_id}, Questions: {len(questions)}, Answers: {len(normalized_answers)}")
+        question_map[qid] = {
+            'text': q['question_text'],
+            'correct': q['correct_option_index'],
+            'options': opts,
+            'option_count': len(opts)
+        }
+
+    expected_keys = set(question_map.keys())
+    answer_keys = set(str(k) for k in answers.keys())
+
+    if expected_keys != answer_keys:
+        return json_error(f'Answers must include every question exactly once. Missing: {list(expected_keys - answer_keys)}, Extra: {list(answer_keys - expected_keys)}', status=400)
+
+    normalized_answers = {}
+    for qid, submitted in answers.items():
+        sqid = str(qid)
+        if sqid not in question_map:
+            return json_error(f'Invalid question id: {sqid}', status=400)
+        try:
+            selected = int(submitted)
+        except (TypeError, ValueError):
+            return json_error(f'Invalid answer for question {sqid}', status=400)
+        option_count = question_map[sqid]['option_count']
+        if selected < 0 or (option_count and selected >= option_count):
+            return json_error(f'Answer out of range for question {sqid}', status=400)
+        normalized_answers[sqid] = selected
+
+    # Calculate score and build details
+    score = 0
+    total = len(questions)
+    logger.debug("[SCORE_DEBUG] Quiz %s, Questions: %s, Answers: %s", quiz_id, total, len(normalized_answers))
         
-        for qid, meta in question_map.items():
-            user_idx = normalized_answers.get(qid)
-            correct_idx = meta['correct']
-            is_correct = str(user_idx) == str(correct_idx)
-            
-            if is_correct:
-                score += 1
+    for qid, meta in question_map.items():
+        user_idx = normalized_answers[qid]
+        correct_idx = meta['correct']
+        # Both sides are ints (answers normalized above, column is INTEGER)
+        is_correct = user_idx == correct_idx
+        score += is_correct
             
-            # Get option texts
-            user_text = meta['options'][user_idx] if meta['options'] and 0 <= user_idx < len(meta['options']) else "Unknown"
-            correct_text = meta['options'][correct_idx] if meta['options'] and 0 <= correct_idx < len(meta['options']) else "Unknown"
-
-            detailed_results.append({
-                'question_id': qid,
-                'question_text': meta['text'],
-                'user_answer': user_text,
-                'correct_answer': correct_text,
-                'is_correct': is_correct,
-                'user_option_index': user_idx,
-                'correct_option_index': correct_idx
-            })
+        # Get option texts
+        opts = meta['options']
+        n_opts = meta['option_count']
+        user_text = opts[user_idx] if 0 <= user_idx < n_opts else "Unknown"
+        correct_text = opts[correct_idx] if 0 <= correct_idx < n_opts else "Unknown"
+
+        detailed_results.append({
+            'question_id': qid,
+            'question_text': meta['text'],
+            'user_answer': user_text,
+            'correct_answer': correct_text,
+            'is_correct': is_correct,
+            'user_option_index': user_idx,
+            'correct_option_index': correct_idx
+        })
 
-        # ── ATTEMPT-GATED ANSWER VISIBILITY ──
-        # attempt_number = attempts_count + 1 (computed below)
-        current_attempt = attempts_count + 1
-        show_answers = current_attempt >= 3
+    # ── ATTEMPT-GATED ANSWER VISIBILITY ──
+    # attempt_number = attempts_count + 1 (computed below)
+    current_attempt = attempts_count + 1
+    show_answers = current_attempt >= 3
 
-        # SECURITY: Strip correct answers from response for attempts 1-2
-        if not show_answers:
-            for dr in detailed_results:
-                dr.pop('correct_answer', None)
-                dr.pop('correct_option_index', None)
+    # SECURITY: Strip correct answers from response for attempts 1-2
+    if not show_answers:
+        for dr in detailed_results:
+            dr.pop('correct_answer', None)
+            dr.pop('correct_option_index', None)
         
-        logger.info(f"[SCORE_DEBUG] Final score: {score}/{total}")
+    logger.debug("[SCORE_DEBUG] Final score: %s/%s", score, total)
 
-        # Save submission
-        try:
-            submission_id = db.execute_insert(
-                'INSERT INTO quiz_submissions (quiz_id, student_id, score, total, answers, duration_seconds) VALUES (?, ?, ?, ?, ?, ?)',
-                (quiz_id, user_id, score, total, json.dumps(normalized_answers), duration)
-            )
-        except Exception as db_error:
-            logger.exception('Failed to save quiz submission')
-            return json_error('Failed to save submission', status=500, data={'details': str(db_error)})
+    # Save submission
+    submission_id = db.execute_insert(
+        'INSERT INTO quiz_submissions (quiz_id, student_id, score, total, answers, duration_seconds) VALUES (?, ?, ?, ?, ?, ?)',
+        (quiz_id, user_id, score, total, orjson.dumps(normalized_answers).decode(), duration)
+    )
+    dashboard_cache.pop(('student', user_id))
 
-        # Calculate percentage
-        percentage = round((score / total) * 100, 1) if total > 0 else 0
+    # Calculate percentage
+    percentage = round((score / total) * 100, 1) if total > 0 else 0
 
+    adaptive_insights = {
+        'knowledge_gaps_detected': 0,
+        'gaps': [],
+        'recommendations_generated': 0,
+        'recommendations': []
+    }
+
+    # Update adaptive engine immediately (best effort, never fail submission)
+    mistake_notes_data = []
+    try:
+        class_id = quiz['class_id']
+        adaptive.update_student_metrics(user_id, class_id)
+        invalidate_class_analytics(class_id, user_id)
+        gaps = adaptive.analyze_knowledge_gaps(user_id, class_id) or []
+        recs = adaptive.generate_recommendations(user_id, class_id) or []
         adaptive_insights = {
-            'knowledge_gaps_detected': 0,
-            'gaps': [],
-            'recommendations_generated': 0,
-            'recommendations': []
+            'knowledge_gaps_detected': len(gaps),
+            'gaps': gaps[:5],
+            'recommendations_generated': len(recs),
+            'recommendations': recs[:5]
         }
-
-        # Update adaptive engine immediately (best effort, never fail submission)
-        mistake_notes_data = []
-        try:
-            class_id = quiz['class_id']
-            adaptive.update_student_metrics(user_id, class_id)
-            gaps = adaptive.analyze_knowledge_gaps(user_id, class_id) or []
-            recs = adaptive.generate_recommendations(user_id, class_id) or []
-            adaptive_insights = {
-                'knowledge_gaps_detected': len(gaps),
-                'gaps': gaps[:5],
-                'recommendations_generated': len(recs),
-                'recommendations': recs[:5]
-            }
             
-            # Update adaptive quiz profile
-            try:
-                adaptive_quiz.update_adaptive_profile(user_id, class_id, score, total)
-            except Exception as e:
-                logger.error(f"Adaptive profile update failed: {e}")
-
-            # Update skill tree progress
-            try:
-                skill_tree.update_progress_after_quiz(user_id, quiz_id, class_id, score, total)
-            except Exception as e:
-                logger.error(f"Skill tree progress update failed: {e}")
+        # Profile / skill tree / prediction / leaderboard are not part of the response
+        background_executor.submit(_refresh_after_submission, user_id, quiz_id, class_id, score, total)
 
-            # Regenerate exam prediction
+        # Generate mistake notes for wrong answers
+        wrong_questions = [r for r in detailed_results if not r['is_correct']]
+        if wrong_questions:
             try:
-                exam_predictor.generate_prediction(user_id)
-            except Exception as e:
-                logger.error(f"Exam prediction update failed: {e}")
-
-            # Recalculate class leaderboard
-            try:
-                leaderboard_engine.recalculate_class(class_id)
+                mistake_notes_data = adaptive_quiz.generate_mistake_notes(
+                    user_id, quiz_id, class_id, 
+                    [{'question_id': wq.get('question_id', 0),
+                      'question_text': wq['question_text'],
+                      'user_answer': wq['user_answer'],
+                      'correct_answer': wq['correct_answer'],
+                      'topic_tag': ''} for wq in wrong_questions]
+                )
             except Exception as e:
-                logger.error(f"Leaderboard recalculation failed: {e}")
+                logger.error(f"Mistake notes generation failed: {e}")
 
-            # Generate mistake notes for wrong answers
-            wrong_questions = [r for r in detailed_results if not r['is_correct']]
-            if wrong_questions:
-                try:
-                    mistake_notes_data = adaptive_quiz.generate_mistake_notes(
-                        user_id, quiz_id, class_id, 
-                        [{'question_id': wq.get('question_id', 0),
-                          'question_text': wq['question_text'],
-                          'user_answer': wq['user_answer'],
-                          'correct_answer': wq['correct_answer'],
-                          'topic_tag': ''} for wq in wrong_questions]
-                    )
-                except Exception as e:
-                    logger.error(f"Mistake notes generation failed: {e}")
-
-            # Check for badges
-            awarded_badges = []
-            try:
-                # Quiz badges
-                quiz_badges = badge_service.check_quiz_badges(user_id, quiz_id, score, total)
-                if quiz_badges:
-                    awarded_badges.extend(quiz_badges)
+        # Check for badges
+        awarded_badges = []
+        try:
+            # Quiz badges
+            quiz_badges = badge_service.check_quiz_badges(user_id, quiz_id, score, total)
+            if quiz_badges:
+                awarded_badges.extend(quiz_badges)
                 
-                # Course completion badge
-                completion_badge = badge_service.check_module_completion(user_id, class_id)
-                if completion_badge:
-                    awarded_badges.append(completion_badge)
+            # Course completion badge
+            completion_badge = badge_service.check_module_completion(user_id, class_id)
+            if completion_badge:
+                awarded_badges.append(completion_badge)
                     
-            except Exception as e:
-                logger.error(f"Badge check failed: {e}")
-
         except Exception as e:
-            logger.error(f"Adaptive update failed for user={user_id} quiz={quiz_id}: {e}")
-            awarded_badges = [] # Ensure defined via fallback if outer except catches
-
-        # SECURITY: Strip mistake notes for attempts 1-2 (they contain correct answers)
-        safe_mistake_notes = mistake_notes_data if show_answers else []
+            logger.error(f"Badge check failed: {e}")
 
-        return json_success(
-            message='Quiz submitted successfully',
-            data={
-                'score': score,
-                'total': total,
-                'percentage': percentage,
-                'attempt_number': current_attempt,
-                'show_answers': show_answers,
-                'adaptive_insights': adaptive_insights,
-                'question_results': detailed_results,
-                'badges': awarded_badges,
-                'mistake_notes': safe_mistake_notes
-            },
-            score=score,
-            total=total,
-            percentage=percentage,
-            attempt_number=current_attempt,
-            show_answers=show_answers,
-            adaptive_insights=adaptive_insights,
-            question_results=detailed_results,
-            badges=awarded_badges,
-            mistake_notes=safe_mistake_notes
-        )
     except Exception as e:
-        logger.exception('Unhandled error in quiz submission')
-        return json_error('Failed to submit quiz', status=500, data={'details': str(e)})
+        logger.error(f"Adaptive update failed for user={user_id} quiz={quiz_id}: {e}")
+        awarded_badges = [] # Ensure defined via fallback if outer except catches
+
+    # SECURITY: Strip mistake notes for attempts 1-2 (they contain correct answers)
+    safe_mistake_notes = mistake_notes_data if show_answers else []
+
+    return json_success(
+        message='Quiz submitted successfully',
+        data={
+            'score': score,
+            'total': total,
+            'percentage': percentage,
+            'attempt_number': current_attempt,
+            'show_answers': show_answers,
+            'adaptive_insights': adaptive_insights,
+            'question_results': detailed_results,
+            'badges': awarded_badges,
+            'mistake_notes': safe_mistake_notes
+        },
+        score=score,
+        total=total,
+        percentage=percentage,
+        attempt_number=current_attempt,
+        show_answers=show_answers,
+        adaptive_insights=adaptive_insights,
+        question_results=detailed_results,
+        badges=awarded_badges,
+        mistake_notes=safe_mistake_notes
+    )
 
 
 @app.route('/api/quiz/<int:quiz_id>/submit', methods=['POST'])
@@ -1823,46 +2068,68 @@ def generate_skill_tree_route():
 
 @app.route('/api/analytics')
 @login_required
+@conditional
 def get_analytics():
     """Get analytics data"""
-    if session['role'] == 'student':
+    role = session['role']
+    user_id = get_current_user_id()
+    class_id = request.args.get('class_id') if role != 'student' else None
+    metrics = analytics_cache.get_or_set(
+        ('analytics', role, user_id, class_id),
+        lambda: _load_analytics(role, user_id, class_id)
+    )
+    return jsonify(metrics)
+
+
+def invalidate_class_analytics(class_id, student_id):
+    """Drop only the cached analytics a new submission in class_id can change.
+
+    Keys are ('analytics', role, user_id, class_id_arg) and ('feedback', teacher_id);
+    other classes' views stay warm.
+    """
+    class_arg = str(class_id)
+    analytics_cache.pop_where(lambda key: (
+        key[0] == 'feedback'  # derived from recent submissions
+        or (key[1] == 'student' and key[2] == student_id)
+        or (key[1] != 'student' and key[3] in (None, class_arg))
+    ))
+
+
+def _load_analytics(role, user_id, class_id):
+    """Run the student_metrics query matching the caller's role."""
+    if role == 'student':
         # Student sees their own metrics
-        metrics = db.execute_query(
+        return db.execute_query(
             '''SELECT sm.*, c.title as class_name
                FROM student_metrics sm
                JOIN classes c ON sm.class_id = c.id
                WHERE sm.user_id = ?''',
-            (get_current_user_id(),)
+            (user_id,)
         )
-        return jsonify(metrics)
-    else:
-        # Teacher sees all students in their classes
-        class_id = request.args.get('class_id')
-        
-        if class_id:
-            metrics = db.execute_query(
-                '''SELECT sm.*, u.name as student_name
-                   FROM student_metrics sm
-                   JOIN users u ON sm.user_id = u.id
-                   WHERE sm.class_id = ?
-                   ORDER BY sm.rating DESC''',
-                (class_id,)
-            )
-        else:
-            metrics = db.execute_query(
-                '''SELECT sm.*, u.name as student_name, c.title as class_name
-                   FROM student_metrics sm
-                   JOIN users u ON sm.user_id = u.id
-                   JOIN classes c ON sm.class_id = c.id
-                   WHERE c.teacher_id = ?
-                   ORDER BY sm.rating DESC''',
-                (get_current_user_id(),)
-            )
-        
-        return jsonify(metrics)
+
+    # Teacher sees all students in their classes
+    if class_id:
+        return db.execute_query(
+            '''SELECT sm.*, u.name as student_name
+               FROM student_metrics sm
+               JOIN users u ON sm.user_id = u.id
+               WHERE sm.class_id = ?
+               ORDER BY sm.rating DESC''',
+            (class_id,)
+        )
+    return db.execute_query(
+        '''SELECT sm.*, u.name as student_name, c.title as class_name
+           FROM student_metrics sm
+           JOIN users u ON sm.user_id = u.id
+           JOIN classes c ON sm.class_id = c.id
+           WHERE c.teacher_id = ?
+           ORDER BY sm.rating DESC''',
+        (user_id,)
+    )
 
 @app.route('/api/class/<int:class_id>/progress')
 @login_required
+@conditional
 def get_class_progress(class_id):
     """Get student progress in a class"""
     metrics = db.execute_one(
@@ -1887,7 +2154,7 @@ def get_learning_path(class_id):
     
     # 1. Verify enrollment
     enrollment = db.execute_one(
-        'SELECT id FROM enrollments WHERE student_id = ? AND class_id = ?',
+        SQL_ENROLLMENT_CHECK,
         (user_id, class_id)
     )
     if not enrollment:
@@ -1905,26 +2172,62 @@ def get_learning_path(class_id):
         'next_action': next_action
     })
 
+def _load_pending_recommendations(user_id, limit=10):
+    """Return (rows, uncovered) for the student's enrolled classes.
+
+    rows are the unfinished recommendation rows, mapped onto whichever recommendations
+    schema is deployed; uncovered lists the enrolled class ids that have none.
+    """
+    cols = table_columns('recommendations')
+    # Without class_id the stored rows cannot be attributed to classes, so regenerate all
+    if 'class_id' not in cols:
+        enrollments = db.execute_query('SELECT class_id FROM enrollments WHERE student_id = ?', (user_id,))
+        return [], [enrollment['class_id'] for enrollment in enrollments]
+    uncovered = db.execute_query(
+        '''SELECT e.class_id FROM enrollments e
+           WHERE e.student_id = ? AND NOT EXISTS (
+               SELECT 1 FROM recommendations r
+               WHERE r.user_id = e.student_id AND r.class_id = e.class_id AND r.is_completed = 0)''',
+        (user_id,)
+    )
+    wanted = ['id', 'content_type as type' if 'content_type' in cols else 'type', 'content_id',
+              'title', 'description', 'action', 'reason', 'resource_url', 'priority']
+    select = ', '.join(c for c in wanted if c.split(' ')[0] in cols)
+    rows = db.execute_query(
+        f'''SELECT {select}
+            FROM recommendations
+            WHERE user_id = ? AND is_completed = 0
+              AND class_id IN (SELECT class_id FROM enrollments WHERE student_id = ?)
+            ORDER BY priority DESC, created_at DESC LIMIT ?''',
+        (user_id, user_id, limit)
+    )
+    return rows, [row['class_id'] for row in uncovered]
+
+
 @app.route('/api/student/recommendations')
 @login_required
 def get_student_recommendations():
     """Get personalized recommendations across all enrolled classes"""
     user_id = get_current_user_id()
-    
-    # Get all enrollments
-    enrollments = db.execute_query(
-        'SELECT class_id FROM enrollments WHERE student_id = ?',
-        (user_id,)
-    )
-    
+
+    # Pending rows are regenerated per class on every quiz submission; only build the
+    # classes that have none from scratch
+    stored, class_ids = _load_pending_recommendations(user_id)
+    if not class_ids:
+        return jsonify({'success': True, 'recommendations': stored})
+
     all_recs = []
     seen_ids = set()
-    
-    for enrollment in enrollments:
-        class_id = enrollment['class_id']
-        # Use existing service method
-        recs = adaptive.generate_recommendations(user_id, class_id)
-        
+
+    # Generate per class concurrently; each DB call checks out its own pooled connection,
+    # and each class's rows are replaced in their own transaction, so workers don't clash
+    with ThreadPoolExecutor(max_workers=min(len(class_ids), 8)) as executor:
+        per_class_recs = list(executor.map(
+            lambda class_id: adaptive.generate_recommendations(user_id, class_id),
+            class_ids
+        ))
+
+    for recs in [stored] + per_class_recs:
         # Deduplicate and add
         for rec in recs:
             # Create a unique key for deduplication
@@ -1940,6 +2243,7 @@ def get_student_recommendations():
 
 @app.route('/api/student/knowledge-gaps')
 @login_required
+@conditional
 def get_student_knowledge_gaps():
     """Get knowledge gaps across all enrolled classes"""
     user_id = get_current_user_id()
@@ -1960,6 +2264,7 @@ def get_student_knowledge_gaps():
 
 @app.route('/api/student/analytics-overview')
 @login_required
+@conditional
 def get_student_analytics_overview():
     """Get aggregated analytics for the student dashboard"""
     user_id = get_current_user_id()
@@ -2048,7 +2353,7 @@ def get_available_classes():
         ORDER BY c.created_at DESC
     '''
     
-    classes = db.execute_query(query, (user_id,))
+    classes = listing_cache.get_or_set(('available', user_id), lambda: db.execute_query(query, (user_id,)))
     return jsonify(classes)
 
 # ============================================================================
@@ -2059,20 +2364,19 @@ def get_available_classes():
 @login_required
 def quiz_view_page(quiz_id):
     """Quiz taking page"""
-    # Verify quiz exists
-    quiz = db.execute_one('SELECT id, title FROM quizzes WHERE id = ?', (quiz_id,))
+    # Quiz existence and the caller's enrollment in its class in one round trip
+    quiz = db.execute_one('''
+        SELECT q.id, q.class_id, e.id as enrollment_id
+        FROM quizzes q
+        LEFT JOIN enrollments e ON e.class_id = q.class_id AND e.student_id = ?
+        WHERE q.id = ?
+    ''', (get_current_user_id(), quiz_id))
     if not quiz:
         return "Quiz not found", 404
         
     # Check access (student must be enrolled)
-    if session['role'] == 'student':
-        quiz_data = db.execute_one('SELECT class_id FROM quizzes WHERE id = ?', (quiz_id,))
-        enrollment = db.execute_one(
-            'SELECT id FROM enrollments WHERE student_id = ? AND class_id = ?',
-            (get_current_user_id(), quiz_data['class_id'])
-        )
-        if not enrollment:
-            return "Access denied", 403
+    if session['role'] == 'student' and quiz['enrollment_id'] is None:
+        return "Access denied", 403
             
     return render_template('quiz_view.html', quiz_id=quiz_id)
 
@@ -2081,6 +2385,7 @@ def quiz_view_page(quiz_id):
 @rate_limit(calls=12, period=60)
 def chatbot():
     """KyKnoX AI chatbot endpoint with multilingual support"""
+    user_id = get_current_user_id()
     data = request.json or {}
     prompt = sanitize_input(data.get('prompt', ''), max_length=2000)
     mode = data.get('mode', 'expert')
@@ -2091,125 +2396,119 @@ def chatbot():
 
     # Get student context for personalization
     try:
-        student_context = adaptive.get_student_context(get_current_user_id()) or {}
+        student_context = adaptive.get_student_context(user_id) or {}
     except Exception:
         student_context = {}
 
     # Get role from session
     role = session.get('role', 'student')
 
-    # Generate AI response with language support
-    try:
-        # Pass language to AI generation
-        answer, provider = kyknox.generate_response(prompt, mode, student_context, role, language=language)
-        rendered_answer = kyknox.render_markdown(answer)
-    except Exception as e:
-        logger.exception('AI generation failed')
-        return jsonify({'success': False, 'error': 'AI generation failed', 'message': str(e)}), 500
+    # Clients that poll get a task id straight away; the LLM call runs on ai_executor
+    if data.get('async'):
+        task_id = uuid.uuid4().hex
+        chatbot_inflight[task_id] = user_id
+        chatbot_results.set(task_id, {'user_id': user_id, 'state': 'pending'})
+        ai_executor.submit(_chatbot_task, task_id, user_id, prompt, mode, student_context, role, language)
+        return jsonify({'success': True, 'task_id': task_id, 'state': 'pending'}), 202
 
-    # Save to database (best-effort)
+    # Hand the request's DB connection back to the pool for the duration of the LLM call
+    db.close_request_connection()
     try:
-        db.execute_insert(
-            'INSERT INTO ai_queries (user_id, prompt, response, provider, mode) VALUES (?, ?, ?, ?, ?)',
-            (get_current_user_id(), prompt, answer, provider, mode)
-        )
+        payload = _run_chatbot(user_id, prompt, mode, student_context, role, language)
     except Exception:
-        logger.exception('Failed to save ai query')
+        logger.exception('AI generation failed')
+        return jsonify({'success': False, 'error': 'AI generation failed', 'message': 'AI generation failed'}), 500
+    return jsonify(payload), 200
 
-    return jsonify({
+
+def _run_chatbot(user_id, prompt, mode, student_context, role, language):
+    """Generate, render and persist one chatbot answer; returns the response payload."""
+    # Pass language to AI generation
+    answer, provider = kyknox.generate_response(prompt, mode, student_context, role, language=language)
+    rendered_answer = kyknox.render_markdown(answer)
+
+    # Save to database (best-effort, off the response path)
+    background_executor.submit(_save_ai_query, (user_id, prompt, answer, rendered_answer, provider, mode))
+
+    return {
         'success': True,
         'reply': rendered_answer,
         'raw': answer,
         'provider': provider,
         'personalized': bool(student_context.get('weak_topics'))
-    }), 200
+    }
+
+
+def _ai_queries_have_html():
+    return 'response_html' in table_columns('ai_queries')
+
+
+def _save_ai_query(params):
+    # The new id is never used, so skip RETURNING id
+    try:
+        if _ai_queries_have_html():
+            db.execute_update(SQL_INSERT_AI_QUERY, params)
+        else:
+            user_id, prompt, response, _html, provider, mode = params
+            db.execute_update(SQL_INSERT_AI_QUERY_LEGACY, (user_id, prompt, response, provider, mode))
+    except Exception:
+        logger.exception('Failed to save ai query')
+
+
+def _chatbot_task(task_id, user_id, *args):
+    try:
+        result = {'user_id': user_id, 'state': 'done', 'payload': _run_chatbot(user_id, *args)}
+    except Exception:
+        logger.exception('AI generation failed')
+        result = {'user_id': user_id, 'state': 'failed', 'message': 'AI generation failed'}
+    try:
+        chatbot_results.set(task_id, result)
+    finally:
+        chatbot_inflight.pop(task_id, None)
+
+
+@app.route('/api/chatbot/result/<task_id>')
+@api_login_required
+def chatbot_result(task_id):
+    """Poll an async /api/chatbot job."""
+    result = chatbot_results.get(task_id)
+    if result is None and task_id in chatbot_inflight:
+        result = {'user_id': chatbot_inflight.get(task_id), 'state': 'pending'}
+    if not result or result['user_id'] != get_current_user_id():
+        return json_error('Unknown or expired task', status=404)
+    if result['state'] == 'pending':
+        return jsonify({'success': True, 'task_id': task_id, 'state': 'pending'}), 202
+    if result['state'] == 'failed':
+        return jsonify({'success': False, 'error': 'AI generation failed', 'message': result['message']}), 500
+    chatbot_results.pop(task_id)
+    return jsonify(result['payload']), 200
 
 @app.route('/api/ai/history')
 @api_login_required
 def get_ai_history():
     """Get recent AI chat history"""
+    has_html = _ai_queries_have_html()
     history = db.execute_query(
-        'SELECT prompt, response, created_at FROM ai_queries WHERE user_id = ? ORDER BY created_at DESC LIMIT 50',
+        SQL_AI_HISTORY if has_html else SQL_AI_HISTORY_LEGACY,
         (get_current_user_id(),)
     )
-    # Render markdown for history items too
+    # HTML is stored at insert; render and backfill only rows saved before that
+    backfill = []
     for item in history:
-        item['response'] = kyknox.render_markdown(item['response'])
+        html_response = item.pop('response_html')
+        if html_response is None:
+            html_response = kyknox.render_markdown(item['response'])
+            backfill.append((html_response, item['id']))
+        item['response'] = html_response
+        del item['id']
+    if backfill and has_html:
+        try:
+            db.execute_many('UPDATE ai_queries SET response_html = ? WHERE id = ?', backfill)
+        except Exception:
+            logger.exception('Failed to backfill ai_queries.response_html')
         
     return jsonify(history)
 
-@app.route('/api/student/recommendations')
-@api_login_required
-def get_recommendations():
-    """Get AI recommendations for student"""
-    user_id = get_current_user_id()
-    # Check which columns the recommendations table has
-    rec_col_rows = db.execute_query(
-        "SELECT column_name FROM information_schema.columns WHERE table_schema='public' AND table_name='recommendations'"
-    )
-    rec_cols = {row.get('column_name') for row in rec_col_rows}
-
-    # Try getting from DB first
-    if {'content_type', 'content_id', 'reason'}.issubset(rec_cols):
-        recs = db.execute_query(
-            '''SELECT id, content_type as type, content_id, reason, priority, created_at
-               FROM recommendations 
-               WHERE user_id = ? AND is_completed = 0 
-               ORDER BY priority DESC, created_at DESC LIMIT 8''',
-            (user_id,)
-        )
-    else:
-        recs = db.execute_query(
-            '''SELECT id, type, title, description, resource_url, priority, created_at
-               FROM recommendations 
-               WHERE user_id = ? AND is_completed = 0 
-               ORDER BY priority DESC, created_at DESC LIMIT 8''',
-            (user_id,)
-        )
-    
-    # If no recommendations, generate some basic ones using Adaptive Learning
-    if not recs:
-        # Check for enrolled classes to generate context
-        enrolled = db.execute_query(
-            'SELECT class_id FROM enrollments WHERE student_id = ? LIMIT 1',
-             (user_id,)
-        )
-        if enrolled:
-             # Trigger generation (this would normally be async)
-             adaptive.generate_recommendations(user_id, enrolled[0]['class_id'])
-             # Fetch again
-             if {'content_type', 'content_id', 'reason'}.issubset(rec_cols):
-                 recs = db.execute_query(
-                    '''SELECT id, content_type as type, content_id, reason, priority, created_at
-                       FROM recommendations 
-                       WHERE user_id = ? AND is_completed = 0 
-                       ORDER BY priority DESC, created_at DESC LIMIT 8''',
-                    (user_id,)
-                )
-             else:
-                 recs = db.execute_query(
-                    '''SELECT id, type, title, description, resource_url, priority, created_at
-                       FROM recommendations 
-                       WHERE user_id = ? AND is_completed = 0 
-                       ORDER BY priority DESC, created_at DESC LIMIT 8''',
-                    (user_id,)
-                )
-
-    # Normalize recommendation cards
-    normalized = []
-    for rec in recs:
-        normalized.append({
-            'id': rec.get('id'),
-            'type': rec.get('type') or rec.get('content_type') or 'resource',
-            'title': rec.get('title') or f"Recommended {rec.get('type', 'content').title()}",
-            'description': rec.get('description') or rec.get('reason') or 'Based on your recent performance',
-            'resource_url': rec.get('resource_url'),
-            'priority': rec.get('priority', 1)
-        })
-
-    return json_success(message='Recommendations loaded', data={'recommendations': normalized}, recommendations=normalized)
-
-
 
 @app.route('/student/micro-learning')
 @login_required
@@ -2287,6 +2586,7 @@ def refresh_micro_tasks():
 
 @app.route('/api/student/quiz-history')
 @api_login_required
+@conditional
 def get_student_quiz_history_api():
     """Get student's quiz submission history"""
     user_id = get_current_user_id()
@@ -2307,15 +2607,6 @@ def get_student_quiz_history_api():
         where_clause += ' AND c.id = ?'
         params.append(class_id)
 
-    count_query = f'''
-        SELECT COUNT(*) as total_count
-        FROM quiz_submissions qs
-        JOIN quizzes q ON qs.quiz_id = q.id
-        JOIN classes c ON q.class_id = c.id
-        {where_clause}
-    '''
-    total_count = db.execute_one(count_query, tuple(params))['total_count']
-    total_pages = max(1, (total_count + per_page - 1) // per_page)
     offset = (page - 1) * per_page
 
     history_query = f'''
@@ -2337,7 +2628,8 @@ def get_student_quiz_history_api():
                 WHEN (qs.score * 100.0 / NULLIF(qs.total, 0)) >= 60 THEN 'Medium'
                 ELSE 'Hard'
             END as difficulty,
-            (SELECT COUNT(*) FROM quiz_submissions WHERE quiz_id = qs.quiz_id AND student_id = ? AND id <= qs.id) as attempt_number
+            ROW_NUMBER() OVER (PARTITION BY qs.quiz_id ORDER BY qs.id) as attempt_number,
+            COUNT(*) OVER () as total_count
            FROM quiz_submissions qs
            JOIN quizzes q ON qs.quiz_id = q.id
            JOIN classes c ON q.class_id = c.id
@@ -2345,8 +2637,24 @@ def get_student_quiz_history_api():
            ORDER BY {order_by}
            LIMIT ? OFFSET ?
     '''
-    query_params = [user_id] + params + [per_page, offset]
-    history = db.execute_query(history_query, tuple(query_params))
+    history = db.execute_query(history_query, tuple(params + [per_page, offset]))
+
+    # The window count rides along with the page; only an out-of-range page needs its own COUNT
+    if history:
+        total_count = history[0]['total_count']
+        for row in history:
+            del row['total_count']
+    elif page > 1:
+        total_count = db.execute_one(f'''
+            SELECT COUNT(*) as total_count
+            FROM quiz_submissions qs
+            JOIN quizzes q ON qs.quiz_id = q.id
+            JOIN classes c ON q.class_id = c.id
+            {where_clause}
+        ''', tuple(params))['total_count']
+    else:
+        total_count = 0
+    total_pages = max(1, (total_count + per_page - 1) // per_page)
 
     return json_success(
         message='Quiz history loaded',
@@ -2380,12 +2688,13 @@ def create_live_session():
     
     if not class_id:
         return jsonify({'error': 'Class ID required'}), 400
+    try:
+        class_id = int(class_id)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid class ID'}), 400
         
     # Check if session already active
-    active = db.execute_one(
-        'SELECT * FROM live_sessions WHERE class_id = ? AND is_active = 1',
-        (class_id,)
-    )
+    active = get_active_live_session(class_id)
     
     if active:
         return jsonify({
@@ -2394,16 +2703,13 @@ def create_live_session():
         })
         
     # Generate unique room name: ClassName-TeacherName-Random
-    import random
-    import string
-    
     class_info = db.execute_one('SELECT title FROM classes WHERE id = ?', (class_id,))
     if not class_info:
         return jsonify({'error': 'Class not found'}), 404
         
-    clean_title = "".join(c for c in class_info['title'] if c.isalnum())
-    clean_name = "".join(c for c in session.get('name', 'Teacher') if c.isalnum())
-    random_suffix = "".join(random.choices(string.ascii_letters + string.digits, k=6))
+    clean_title = NON_ALNUM_RE.sub('', class_info['title'])
+    clean_name = NON_ALNUM_RE.sub('', session.get('name', 'Teacher'))
+    random_suffix = secrets.token_urlsafe(5)
     
     room_name = f"LearnVaultX-{clean_title}-{clean_name}-{random_suffix}"
     
@@ -2413,9 +2719,11 @@ def create_live_session():
                VALUES (?, ?, ?)''',
             (class_id, room_name, get_current_user_id())
         )
+        live_session_cache.pop(class_id)
         return jsonify({'room_name': room_name, 'message': 'Session created'})
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+    except Exception:
+        logger.exception('Failed to create live session')
+        return jsonify({'error': 'Failed to create live session'}), 500
 
 @app.route('/api/live/end', methods=['POST'])
 @login_required
@@ -2429,15 +2737,20 @@ def end_live_session():
         return jsonify({'error': 'Room name required'}), 400
         
     try:
-        db.execute_update(
+        ended = db.execute_returning(
             '''UPDATE live_sessions 
                SET is_active = 0, ended_at = CURRENT_TIMESTAMP 
-               WHERE room_name = ? AND started_by = ?''',
+               WHERE room_name = ? AND started_by = ? AND is_active = 1
+               RETURNING class_id''',
             (room_name, get_current_user_id())
         )
+        if not ended:
+            return jsonify({'error': 'No active session found for this room'}), 404
+        live_session_cache.pop(ended['class_id'])
         return jsonify({'message': 'Session ended'})
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+    except Exception:
+        logger.exception('Failed to end live session')
+        return jsonify({'error': 'Failed to end live session'}), 500
 
 @app.route('/live/<room_name>')
 @login_required
@@ -2484,10 +2797,11 @@ def live_class_view(room_name):
 @login_required
 def create_live_class(class_id):
     """Create a live class session (teacher only)"""
+    user_id = get_current_user_id()
     # Verify user is the teacher of this class
     class_info = db.execute_one(
-        'SELECT * FROM classes WHERE id = ? AND teacher_id = ?',
-        (class_id, get_current_user_id())
+        'SELECT 1 FROM classes WHERE id = ? AND teacher_id = ?',
+        (class_id, user_id)
     )
     
     if not class_info:
@@ -2497,10 +2811,7 @@ def create_live_class(class_id):
     room_name = data.get('room_name', f"LearnVaultX-Class-{class_id}-{datetime.now().strftime('%Y%m%d%H%M%S')}")
     
     # Check if there's already an active session
-    existing = db.execute_one(
-        'SELECT * FROM live_sessions WHERE class_id = ? AND is_active = 1',
-        (class_id,)
-    )
+    existing = get_active_live_session(class_id)
     
     if existing:
         return jsonify({
@@ -2512,8 +2823,9 @@ def create_live_class(class_id):
     # Create new live session
     session_id = db.execute_insert(
         'INSERT INTO live_sessions (class_id, room_name, started_by, is_active) VALUES (?, ?, ?, 1)',
-        (class_id, room_name, get_current_user_id())
+        (class_id, room_name, user_id)
     )
+    live_session_cache.pop(class_id)
     
     logger.info(f"Live class created: {room_name} for class {class_id}")
     
@@ -2528,22 +2840,20 @@ def create_live_class(class_id):
 @login_required
 def join_live_class(class_id):
     """Join an active live class session (students and teacher)"""
+    user_id = get_current_user_id()
     # Check if user is enrolled or is the teacher
     enrollment = db.execute_one(
-        '''SELECT e.*, c.teacher_id FROM enrollments e
+        '''SELECT e.id FROM enrollments e
            JOIN classes c ON e.class_id = c.id
            WHERE e.class_id = ? AND (e.student_id = ? OR c.teacher_id = ?)''',
-        (class_id, get_current_user_id(), get_current_user_id())
+        (class_id, user_id, user_id)
     )
     
     if not enrollment:
         return jsonify({'error': 'Not enrolled in this class'}), 403
     
     # Get active session
-    active_session = db.execute_one(
-        'SELECT * FROM live_sessions WHERE class_id = ? AND is_active = 1',
-        (class_id,)
-    )
+    active_session = get_active_live_session(class_id)
     
     if not active_session:
         return jsonify({'error': 'No active live session'}), 404
@@ -2558,10 +2868,7 @@ def join_live_class(class_id):
 @login_required
 def live_class_status(class_id):
     """Check if there's an active live session"""
-    active_session = db.execute_one(
-        'SELECT * FROM live_sessions WHERE class_id = ? AND is_active = 1',
-        (class_id,)
-    )
+    active_session = get_active_live_session(class_id)
     
     if active_session:
         return jsonify({
@@ -2576,20 +2883,26 @@ def live_class_status(class_id):
 @login_required
 def end_live_class(class_id):
     """End a live class session (teacher only)"""
-    # Verify user is the teacher
-    class_info = db.execute_one(
-        'SELECT * FROM classes WHERE id = ? AND teacher_id = ?',
-        (class_id, get_current_user_id())
+    user_id = get_current_user_id()
+    # End the active session only if the caller teaches the class; the ownership check rides in the WHERE
+    ended = db.execute_returning(
+        '''UPDATE live_sessions SET is_active = 0, ended_at = CURRENT_TIMESTAMP
+           WHERE class_id = ? AND is_active = 1
+             AND EXISTS (SELECT 1 FROM classes WHERE id = ? AND teacher_id = ?)
+           RETURNING id''',
+        (class_id, class_id, user_id)
     )
     
-    if not class_info:
-        return jsonify({'error': 'Not authorized'}), 403
-    
-    # End active session
-    db.execute_update(
-        'UPDATE live_sessions SET is_active = 0, ended_at = CURRENT_TIMESTAMP WHERE class_id = ? AND is_active = 1',
-        (class_id,)
-    )
+    if not ended:
+        # Nothing updated: tell "not yours" apart from "nothing to end"
+        owns_class = db.execute_one(
+            'SELECT 1 FROM classes WHERE id = ? AND teacher_id = ?',
+            (class_id, user_id)
+        )
+        if not owns_class:
+            return jsonify({'error': 'Not authorized'}), 403
+        return jsonify({'error': 'No active live session'}), 404
+    live_session_cache.pop(class_id)
     
     return jsonify({'message': 'Live session ended'}), 200
 
@@ -2684,7 +2997,6 @@ def teacher_analytics_page():
 @app.route('/sitemap.xml')
 def sitemap():
     """Generate sitemap.xml for search engines"""
-    from flask import Response
     host = request.host_url.rstrip('/')
     pages = [
         {'loc': f'{host}/', 'priority': '1.0', 'changefreq': 'weekly'},
@@ -2705,7 +3017,6 @@ def sitemap():
 @app.route('/robots.txt')
 def robots():
     """Serve robots.txt for search engines"""
-    from flask import Response
     host = request.host_url.rstrip('/')
     content = f"""User-agent: *
 Allow: /
@@ -2743,22 +3054,31 @@ def forbidden(e):
 @app.errorhandler(Exception)
 def handle_exception(e):
     """Global exception handler to prevent app crashes and hide sensitive info"""
-    # Log the full traceback internally
-    logger.exception(f"Unhandled Exception: {e}")
-    if hasattr(db, 'db'):
-        db.db.rollback()
-        
     # Standard Flask HTTP errors should just be returned
-    from werkzeug.exceptions import HTTPException
     if isinstance(e, HTTPException):
         return e
 
+    # Log the full traceback internally (the request connection rolls itself back)
+    logger.exception("Unhandled exception on %s %s", request.method, request.path)
+
     # Return safe 500 response
     if request.path.startswith('/api/'):
         return jsonify({'error': 'Internal server error', 'success': False}), 500
     return render_template('500.html'), 500
 
 
+def _check_duplicate_routes():
+    """Fail fast if two views claim the same rule + method (Flask silently serves only the first)."""
+    seen = {}
+    for rule in app.url_map.iter_rules():
+        for method in rule.methods - {'HEAD', 'OPTIONS'}:
+            other = seen.setdefault((rule.rule, method), rule.endpoint)
+            if other != rule.endpoint:
+                raise RuntimeError(f"Duplicate route {method} {rule.rule}: {other} and {rule.endpoint}")
+
+_check_duplicate_routes()
+
+
 # ============================================================================
 # MAIN
 # ============================================================================
@@ -2768,6 +3088,7 @@ if __name__ == '__main__':
     pass
     
     # Run server
+    start_background_jobs()
     port = int(os.getenv('PORT', 5050))
     logger.info(f"Starting LearnVaultX server on port {port}")
     
@@ -2802,7 +3123,7 @@ if __name__ == '__main__':
                 app,
                 host='0.0.0.0',
                 port=fallback_port,
-                debug=True,
+                debug=False,
                 use_reloader=False,
                 log_output=True,
                 allow_unsafe_werkzeug=True
@@ -20,6 +20,23 @@ class Config:
     SESSION_COOKIE_SECURE = os.environ.get('SESSION_COOKIE_SECURE', 'False').lower() == 'true'
     SESSION_COOKIE_HTTPONLY = True
 
+    # Signup
+    # Email OTP verification on signup; when off, accounts are created verified
+    OTP_REQUIRED_SIGNUP = os.environ.get('OTP_REQUIRED_SIGNUP', 'True').lower() == 'true'
+    # Key for OTP digests (falls back to SECRET_KEY); required outside debug
+    OTP_PEPPER = os.environ.get('OTP_PEPPER', '')
+
+    # Reverse proxies in front of the app whose X-Forwarded-For is trusted (Render: 1).
+    # Rate limits key on the client address, which is otherwise the proxy's for everyone
+    PROXY_FIX_X_FOR = int(os.environ.get('PROXY_FIX_X_FOR', '0'))
+
+    # Server-side sessions (optional) — set REDIS_URL (redis:// or unix://) to keep
+    # session data in Redis; the cookie then only carries a session id
+    REDIS_URL = os.environ.get('REDIS_URL', '')
+    SESSION_KEY_PREFIX = 'lvx:session:'
+    # Socket.IO message queue (also REDIS_URL) — pub/sub channel shared by all workers
+    SOCKETIO_CHANNEL = os.environ.get('SOCKETIO_CHANNEL', 'lvx-socketio')
+
     # Database — PostgreSQL via SQLAlchemy
     DATABASE_URL = os.environ.get(
         'DATABASE_URL',
@@ -29,6 +46,13 @@ class Config:
     if DATABASE_URL.startswith('postgres://'):
         DATABASE_URL = DATABASE_URL.replace('postgres://', 'postgresql://', 1)
 
+    # Per-connection PostgreSQL settings for the dashboard/analytics reads:
+    # work_mem keeps the grouped joins' hash aggregates and sorts in memory,
+    # and JIT only adds compile latency to these short queries. lock_timeout
+    # makes a write stuck behind a row lock fail after 5s instead of pinning
+    # a worker thread indefinitely.
+    DB_SESSION_OPTIONS = os.environ.get('DB_SESSION_OPTIONS', '-c work_mem=16MB -c jit=off -c lock_timeout=5s')
+
     SQLALCHEMY_DATABASE_URI = DATABASE_URL
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     SQLALCHEMY_ENGINE_OPTIONS = {
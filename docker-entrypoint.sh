@@ -53,12 +53,13 @@ echo "========================================"
 echo "  Starting LearnVaultX on port ${PORT}"
 echo "========================================"
 
-# Use Gunicorn with gthread worker (required for Flask-SocketIO threading mode)
+# Use Gunicorn with gthread worker (required for Flask-SocketIO threading mode).
+# Each open WebSocket holds a thread, so size the pool for concurrent sockets, not CPUs.
 exec gunicorn \
     --bind 0.0.0.0:${PORT} \
     --worker-class gthread \
     --workers 1 \
-    --threads 4 \
+    --threads ${GUNICORN_THREADS:-32} \
     --timeout 120 \
     --access-logfile - \
     --error-logfile - \
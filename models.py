@@ -33,6 +33,7 @@ class Class(db.Model):
     code = db.Column(db.String(10), unique=True)
     subject = db.Column(db.String(200), default='')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    __table_args__ = (db.Index('ix_classes_teacher_created', 'teacher_id', 'created_at'),)
 
 
 class Enrollment(db.Model):
@@ -51,6 +52,7 @@ class Lecture(db.Model):
     filename = db.Column(db.Text, nullable=False)
     filepath = db.Column(db.Text, nullable=False)
     uploaded_at = db.Column(db.DateTime, default=datetime.utcnow)
+    __table_args__ = (db.Index('ix_lectures_class_uploaded', 'class_id', 'uploaded_at'),)
 
 
 class ChatMessage(db.Model):
@@ -59,7 +61,9 @@ class ChatMessage(db.Model):
     class_id = db.Column(db.Integer, db.ForeignKey('classes.id'), nullable=False, index=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     message = db.Column(db.Text, nullable=False)
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    # server_default so raw-SQL inserts (DatabaseManager) get a timestamp without passing one
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow, server_default=db.func.now())
+    __table_args__ = (db.Index('ix_chat_class_ts', 'class_id', 'timestamp'),)
 
 
 # ─── QUIZZES ───────────────────────────────────────────────────
@@ -96,6 +100,11 @@ class QuizSubmission(db.Model):
     answers = db.Column(db.Text, nullable=False, default='{}')  # JSON
     duration_seconds = db.Column(db.Integer)
     submitted_at = db.Column(db.DateTime, default=datetime.utcnow)
+    __table_args__ = (
+        db.Index('ix_qs_student_quiz_cov', 'student_id', 'quiz_id',
+                 postgresql_include=['score', 'total', 'duration_seconds', 'submitted_at']),
+        db.Index('ix_qs_student_submitted', 'student_id', 'submitted_at'),
+    )
 
 
 # ─── AI ────────────────────────────────────────────────────────
@@ -106,9 +115,12 @@ class AIQuery(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
     prompt = db.Column(db.Text, nullable=False)
     response = db.Column(db.Text, nullable=False)
+    response_html = db.Column(db.Text)  # rendered markdown, stored at insert
     provider = db.Column(db.String(50), default='Groq')
     mode = db.Column(db.String(50), default='expert')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # AI history: newest 50 per user (scanned backwards)
+    __table_args__ = (db.Index('ix_aiq_user_created', 'user_id', 'created_at'),)
 
 
 class AIContextSession(db.Model):
@@ -200,6 +212,8 @@ class Recommendation(db.Model):
     __tablename__ = 'recommendations'
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    # Class the recommendation was generated for; regeneration replaces only that class's rows
+    class_id = db.Column(db.Integer, db.ForeignKey('classes.id'), index=True)
     content_type = db.Column(db.String(50), nullable=False)
     content_id = db.Column(db.Integer, nullable=False)
     title = db.Column(db.String(300), default='')
@@ -209,6 +223,9 @@ class Recommendation(db.Model):
     priority = db.Column(db.Integer, default=0)
     is_completed = db.Column(db.Integer, default=0)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Pending recommendations by priority, newest first (scanned backwards)
+    __table_args__ = (db.Index('ix_recs_user_pending', 'user_id', 'priority', 'created_at',
+                               postgresql_where=db.text('is_completed = 0')),)
 
 
 class LearningPath(db.Model):
@@ -376,24 +393,36 @@ class MLQuizBooster(db.Model):
 class PasswordResetOTP(db.Model):
     __tablename__ = 'password_reset_otp'
     id = db.Column(db.Integer, primary_key=True)
-    email = db.Column(db.String(320), nullable=False, index=True)
+    email = db.Column(db.String(320), nullable=False)
     otp = db.Column(db.Text, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     expires_at = db.Column(db.DateTime, nullable=False)
     used = db.Column(db.Integer, default=0)
     attempts = db.Column(db.Integer, default=0)
+    # Verify claims the newest unused row per email (seek on email, used = 0, walk created_at
+    # backwards); invalidation and the last-sent lookup share the email prefix
+    __table_args__ = (
+        db.Index('ix_pwreset_email_used_created', 'email', 'used', 'created_at'),
+        db.Index('ix_pwreset_expires', 'expires_at'),
+    )
 
 
 class OTPRequest(db.Model):
     __tablename__ = 'otp_requests'
     id = db.Column(db.Integer, primary_key=True)
-    email = db.Column(db.String(320), nullable=False, index=True)
+    email = db.Column(db.String(320), nullable=False)
     otp_hash = db.Column(db.Text, nullable=False)
     otp_type = db.Column(db.String(30), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     expires_at = db.Column(db.DateTime, nullable=False)
     attempts = db.Column(db.Integer, default=0)
     is_used = db.Column(db.Integer, default=0)
+    # Latest OTP per (email, type): verify/resend walk this backwards and stop at LIMIT 1.
+    # Replaces the old email-only index, which this one prefixes.
+    __table_args__ = (
+        db.Index('ix_otp_email_type_created', 'email', 'otp_type', 'created_at'),
+        db.Index('ix_otp_expires', 'expires_at'),
+    )
 
 
 # ─── LIVE SESSIONS ─────────────────────────────────────────────
@@ -407,6 +436,10 @@ class LiveSession(db.Model):
     is_active = db.Column(db.Integer, default=1)
     started_at = db.Column(db.DateTime, default=datetime.utcnow)
     ended_at = db.Column(db.DateTime)
+    # Partial covering index: the active-session lookup is an index-only scan
+    __table_args__ = (db.Index('ix_live_active_cov', 'class_id',
+                               postgresql_where=db.text('is_active = 1'),
+                               postgresql_include=['id', 'room_name', 'started_at']),)
 
 
 # ─── FEEDBACK / INTERVENTIONS ─────────────────────────────────
@@ -1,6 +1,7 @@
 import logging
 import json
 
+
 logger = logging.getLogger(__name__)
 
 class AdaptiveEngine:
@@ -57,60 +58,125 @@ class AdaptiveEngine:
                 pace_score = 1.0
             
             # Calculate overall rating (0-100)
-            rating = score_avg * 0.7 + (pace_score * 100) * 0.3
+            rating = min(100, max(0, score_avg * 0.7 + (pace_score * 100) * 0.3))
 
             metrics_cols = self._get_table_columns('student_metrics')
             if not metrics_cols:
                 return
             
-            # Update or insert metrics
-            existing = self.db.execute_one(
-                'SELECT user_id FROM student_metrics WHERE user_id = ? AND class_id = ?',
-                (user_id, class_id)
-            )
-
             # Support both schemas:
             # v1 -> score_avg/avg_time/pace_score/rating
             # v2 -> attendance_score/quiz_score/participation_score/rating
             if {'score_avg', 'avg_time', 'pace_score'}.issubset(metrics_cols):
-                update_sql = '''
-                    UPDATE student_metrics 
-                    SET score_avg = ?, avg_time = ?, pace_score = ?, rating = ?, updated_at = CURRENT_TIMESTAMP
-                    WHERE user_id = ? AND class_id = ?
-                '''
-                update_params = (score_avg, avg_time, pace_score, rating, user_id, class_id)
-                insert_sql = '''
-                    INSERT INTO student_metrics (user_id, class_id, score_avg, avg_time, pace_score, rating)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                '''
-                insert_params = (user_id, class_id, score_avg, avg_time, pace_score, rating)
+                # (user_id, class_id) is the primary key, so one UPSERT updates the row in place
+                self.db.execute_update('''
+                    INSERT INTO student_metrics (user_id, class_id, score_avg, avg_time, pace_score, rating, updated_at)
+                    VALUES (?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+                    ON CONFLICT (user_id, class_id) DO UPDATE
+                    SET score_avg = EXCLUDED.score_avg, avg_time = EXCLUDED.avg_time,
+                        pace_score = EXCLUDED.pace_score, rating = EXCLUDED.rating,
+                        updated_at = EXCLUDED.updated_at
+                ''', (user_id, class_id, score_avg, avg_time, pace_score, rating))
             else:
-                # Fallback for schema_new.sql
+                # Fallback for schema_new.sql (surrogate id, no unique key to conflict on)
                 attendance_score = min(100, max(0, 100 - min(avg_time / 2, 100)))
                 quiz_score = score_avg
                 participation_score = min(100, max(0, pace_score * 100))
-                update_sql = '''
-                    UPDATE student_metrics
-                    SET attendance_score = ?, quiz_score = ?, participation_score = ?, rating = ?, updated_at = CURRENT_TIMESTAMP
-                    WHERE user_id = ? AND class_id = ?
-                '''
-                update_params = (attendance_score, quiz_score, participation_score, rating, user_id, class_id)
-                insert_sql = '''
-                    INSERT INTO student_metrics (user_id, class_id, attendance_score, quiz_score, participation_score, rating)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                '''
-                insert_params = (user_id, class_id, attendance_score, quiz_score, participation_score, rating)
+                existing = self.db.execute_one(
+                    'SELECT user_id FROM student_metrics WHERE user_id = ? AND class_id = ?',
+                    (user_id, class_id)
+                )
+                if existing:
+                    self.db.execute_update('''
+                        UPDATE student_metrics
+                        SET attendance_score = ?, quiz_score = ?, participation_score = ?, rating = ?, updated_at = CURRENT_TIMESTAMP
+                        WHERE user_id = ? AND class_id = ?
+                    ''', (attendance_score, quiz_score, participation_score, rating, user_id, class_id))
+                else:
+                    self.db.execute_insert('''
+                        INSERT INTO student_metrics (user_id, class_id, attendance_score, quiz_score, participation_score, rating)
+                        VALUES (?, ?, ?, ?, ?, ?)
+                    ''', (user_id, class_id, attendance_score, quiz_score, participation_score, rating))
 
-            if existing:
-                self.db.execute_update(update_sql, update_params)
-            else:
-                self.db.execute_insert(insert_sql, insert_params)
-                
             logger.info(f"Updated metrics for student {user_id} in class {class_id}: avg={score_avg:.1f}%, rating={rating:.1f}")
             
         except Exception as e:
             logger.error(f"Error updating student metrics: {e}")
 
+    def recompute_class_metrics(self, class_id):
+        """Rebuild student_metrics for every student in a class in one pass.
+
+        Same formulas as update_student_metrics, but aggregated per student in SQL
+        and computed column-wise with NumPy instead of a Python loop per student.
+        """
+        try:
+            rows = self.db.execute_query('''
+                SELECT student_id,
+                       COUNT(*) AS attempts,
+                       SUM(score) AS score_sum,
+                       SUM(total) AS total_sum,
+                       AVG(duration_seconds) FILTER (WHERE duration_seconds > 0) AS avg_time,
+                       SUM(score) FILTER (WHERE rn <= 3) AS recent_score,
+                       SUM(total) FILTER (WHERE rn <= 3) AS recent_total
+                FROM (
+                    SELECT qs.student_id, qs.score, qs.total, qs.duration_seconds,
+                           ROW_NUMBER() OVER (PARTITION BY qs.student_id ORDER BY qs.submitted_at DESC) AS rn
+                    FROM quiz_submissions qs
+                    JOIN quizzes q ON qs.quiz_id = q.id
+                    WHERE q.class_id = ?
+                ) ranked
+                GROUP BY student_id
+            ''', (class_id,))
+
+            if not rows:
+                return 0
+
+            metrics_cols = self._get_table_columns('student_metrics')
+            if not {'score_avg', 'avg_time', 'pace_score'}.issubset(metrics_cols):
+                # v2 schema: fall back to the per-student path
+                for row in rows:
+                    self.update_student_metrics(row['student_id'], class_id)
+                return len(rows)
+
+            # NumPy is only needed here, so it loads on the first recompute rather than at app import
+            import numpy as np
+
+            student_ids = [row['student_id'] for row in rows]
+            cols = np.array(
+                [[row['attempts'], row['score_sum'], row['total_sum'], row['avg_time'] or 0,
+                  row['recent_score'], row['recent_total']] for row in rows],
+                dtype=np.float64
+            )
+            attempts, score_sum, total_sum, avg_time, recent_score, recent_total = cols.T
+
+            # Guarded divides instead of per-row branches: rows failing `where` keep the `out` default
+            score_avg = np.divide(score_sum * 100, total_sum, out=np.zeros_like(score_sum), where=total_sum > 0)
+            recent_pct = np.divide(recent_score * 100, recent_total, out=np.zeros_like(recent_score), where=recent_total > 0)
+            pace_score = np.divide(recent_pct, score_avg, out=np.ones_like(score_avg), where=(attempts >= 2) & (score_avg > 0))
+
+            # rating = 0.7 * score_avg + 0.3 * (pace_score * 100), as one matrix-vector product, bounded to 0-100
+            rating = np.einsum('ij,j->i', np.column_stack((score_avg, pace_score * 100)), np.array([0.7, 0.3]))
+            rating = np.clip(rating, 0.0, 100.0)
+
+            self.db.execute_many('''
+                INSERT INTO student_metrics (user_id, class_id, score_avg, avg_time, pace_score, rating, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+                ON CONFLICT (user_id, class_id) DO UPDATE
+                SET score_avg = EXCLUDED.score_avg, avg_time = EXCLUDED.avg_time,
+                    pace_score = EXCLUDED.pace_score, rating = EXCLUDED.rating,
+                    updated_at = EXCLUDED.updated_at
+            ''', [
+                (uid, class_id, float(sa), float(at), float(ps), float(r))
+                for uid, sa, at, ps, r in zip(student_ids, score_avg, avg_time, pace_score, rating)
+            ])
+
+            logger.info(f"Recomputed metrics for {len(student_ids)} students in class {class_id}")
+            return len(student_ids)
+
+        except Exception as e:
+            logger.error(f"Error recomputing class metrics: {e}")
+            return 0
+
     def analyze_knowledge_gaps(self, user_id, class_id):
         """Analyze quiz performance to identify knowledge gaps"""
         try:
@@ -154,7 +220,10 @@ class AdaptiveEngine:
             return []
 
     def generate_recommendations(self, user_id, class_id):
-        """Generate personalized content recommendations based on performance"""
+        """Generate personalized content recommendations based on performance.
+
+        Persisted entries come back with their new row ``id`` set.
+        """
         try:
             # Get student's weak areas
             metrics_cols = self._get_table_columns('student_metrics')
@@ -225,44 +294,43 @@ class AdaptiveEngine:
             rec_cols = self._get_table_columns('recommendations')
             if rec_cols and recommendations:
                 try:
-                    # Clear unfinished recs for this user
-                    self.db.execute_update(
-                        'DELETE FROM recommendations WHERE user_id = ? AND is_completed = 0',
-                        (user_id,)
-                    )
-                    
-                    for rec in recommendations:
-                        # Prepare values
-                        r_type = rec.get('type', 'general')
-                        r_cid = rec.get('content_id', 0)
-                        r_title = rec.get('title', 'Recommendation')
-                        r_desc = rec.get('description', '')
-                        r_reason = rec.get('reason', '')
-                        r_priority = rec.get('priority', 50)
-                        r_action = rec.get('action', 'View')
+                    # Check available columns and construct query
+                    per_class = 'class_id' in rec_cols
+                    columns = ['user_id'] + (['class_id'] if per_class else []) + ['content_type', 'content_id']
+                    if 'title' in rec_cols and 'description' in rec_cols:
+                        columns += ['title', 'description'] + (['action'] if 'action' in rec_cols else [])
+                    columns += ['reason', 'priority']
+                    insert_sql = (f"INSERT INTO recommendations ({', '.join(columns)}, is_completed) "
+                                  f"VALUES ({', '.join('?' * len(columns))}, 0)")
 
-                        # Check available columns and construct query
-                        if 'title' in rec_cols and 'description' in rec_cols:
-                            if 'action' in rec_cols:
-                                self.db.execute_insert(
-                                    '''INSERT INTO recommendations (user_id, content_type, content_id, title, description, action, reason, priority, is_completed)
-                                       VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0)''',
-                                    (user_id, r_type, r_cid, r_title, r_desc, r_action, r_reason, r_priority)
-                                )
-                            else:
-                                self.db.execute_insert(
-                                    '''INSERT INTO recommendations (user_id, content_type, content_id, title, description, reason, priority, is_completed)
-                                       VALUES (?, ?, ?, ?, ?, ?, ?, 0)''',
-                                    (user_id, r_type, r_cid, r_title, r_desc, r_reason, r_priority)
-                                )
+                    # Replace only this class's unfinished recs (old schema: no class_id, so all
+                    # of the user's); delete + inserts commit together
+                    with self.db.transaction() as tx:
+                        if per_class:
+                            tx.execute(
+                                'DELETE FROM recommendations WHERE user_id = ? AND class_id = ? AND is_completed = 0',
+                                (user_id, class_id)
+                            )
                         else:
-                            # Fallback to old schema
-                             self.db.execute_insert(
-                                '''INSERT INTO recommendations (user_id, content_type, content_id, reason, priority, is_completed)
-                                   VALUES (?, ?, ?, ?, ?, 0)''',
-                                (user_id, r_type, r_cid, r_reason, r_priority)
+                            tx.execute(
+                                'DELETE FROM recommendations WHERE user_id = ? AND is_completed = 0',
+                                (user_id,)
                             )
 
+                        for rec in recommendations:
+                            values = {
+                                'user_id': user_id,
+                                'class_id': class_id,
+                                'content_type': rec.get('type', 'general'),
+                                'content_id': rec.get('content_id', 0),
+                                'title': rec.get('title', 'Recommendation'),
+                                'description': rec.get('description', ''),
+                                'action': rec.get('action', 'View'),
+                                'reason': rec.get('reason', ''),
+                                'priority': rec.get('priority', 50),
+                            }
+                            rec['id'] = tx.insert(insert_sql, tuple(values[c] for c in columns))
+
                 except Exception as rec_err:
                     logger.error(f"Failed to persist recommendations: {rec_err}")
 
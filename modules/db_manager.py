@@ -10,6 +10,9 @@ handled automatically so callers do not need any changes.
 """
 import re
 import logging
+from contextlib import contextmanager
+from functools import lru_cache
+from flask import g, has_request_context
 from sqlalchemy import create_engine, text
 from sqlalchemy.pool import QueuePool
 
@@ -66,6 +69,62 @@ def _to_named(pg_sql, params):
     return named_sql, param_dict
 
 
+@lru_cache(maxsize=1024)
+def _prepare(query, returning_id=False):
+    """Translate a SQL string once per process and return a reusable text() clause.
+
+    The regex passes above run on every call otherwise; with a stable clause
+    object SQLAlchemy's compiled-statement cache is hit on every repeat.
+    """
+    pg_sql = _sqlite_to_pg(query)
+    if returning_id:
+        # Append RETURNING id for INSERT statements
+        trimmed = pg_sql.strip().rstrip(';')
+        if trimmed.upper().startswith('INSERT') and 'RETURNING' not in trimmed.upper():
+            pg_sql = trimmed + ' RETURNING id'
+    named_sql, _ = _to_named(pg_sql, (None,))
+    return text(named_sql)
+
+
+def _bind(params):
+    """Map positional params onto the :p0, :p1, … names used by _prepare."""
+    return {f'p{i}': v for i, v in enumerate(params or ())}
+
+
+# Connections opened (and returned to the pool) at startup
+WARM_CONNECTIONS = 4
+
+
+class _Transaction:
+    """Statement runner handed out by DatabaseManager.transaction(); commits happen on exit."""
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def execute(self, query, params=()):
+        try:
+            self._conn.execute(_prepare(query), _bind(params))
+        except Exception as e:
+            logger.error(f"Transaction error: {e}\n  SQL: {query}")
+            raise
+
+    def execute_many(self, query, params_list):
+        try:
+            self._conn.execute(_prepare(query), [_bind(params) for params in params_list])
+        except Exception as e:
+            logger.error(f"Transaction batch error: {e}\n  SQL: {query}")
+            raise
+
+    def insert(self, query, params=()):
+        """Execute an INSERT and return the new row id."""
+        try:
+            row = self._conn.execute(_prepare(query, returning_id=True), _bind(params)).fetchone()
+            return row[0] if row else None
+        except Exception as e:
+            logger.error(f"Transaction insert error: {e}\n  SQL: {query}")
+            raise
+
+
 # ──────────────────────────────────────────────────────────────────
 # DATABASE MANAGER
 # ──────────────────────────────────────────────────────────────────
@@ -76,42 +135,99 @@ class DatabaseManager:
     Every module calls:
         db.execute_query(sql, params)     → list[dict]
         db.execute_one(sql, params)       → dict | None
+        db.iter_query(sql, params)        → iterator[dict]
         db.execute_insert(sql, params)    → int  (new row id)
+        db.execute_returning(sql, params) → dict | None
         db.execute_update(sql, params)    → None
+        db.execute_many(sql, params_list) → None
+        with db.transaction() as tx:      → several writes, one commit
     """
 
-    def __init__(self, database_url):
+    def __init__(self, database_url, session_options=None):
         self.database_url = database_url
+        connect_args = {'connect_timeout': 5}
+        if session_options:
+            connect_args['options'] = session_options
         try:
             self.engine = create_engine(
                 database_url,
                 poolclass=QueuePool,
                 pool_pre_ping=True,
-                pool_size=5,
-                max_overflow=10,
-                connect_args={'connect_timeout': 5}
+                pool_size=10,
+                max_overflow=20,
+                # Hand out the most recently returned connection so a few stay hot
+                # and surplus ones age out; recycle before server idle timeouts bite
+                pool_use_lifo=True,
+                pool_recycle=1800,
+                query_cache_size=1200,
+                connect_args=connect_args
             )
-            # Test connection immediately
-            with self.engine.connect() as conn:
-                pass
+            # Test connection immediately, and leave a few open in the pool so the
+            # first requests after a deploy skip the TCP/TLS + auth handshake
+            warm = [self.engine.connect() for _ in range(WARM_CONNECTIONS)]
+            for conn in warm:
+                conn.close()
             logger.info("DatabaseManager successfully connected to PostgreSQL")
         except Exception as e:
             logger.error(f"FATAL: Could not connect to PostgreSQL. Is the server running? Error: {e}")
             # Keep engine object active so app doesn't immediately crash, but queries will fail gracefully
             self.engine = create_engine(database_url)
 
+    def prepare(self, *queries):
+        """Translate and build the clauses for hot queries up front (e.g. at import)."""
+        for query in queries:
+            _prepare(query)
+
     # Keep legacy get_db() for code that calls it directly
     def get_db(self):
         return self.engine.connect()
 
+    @contextmanager
+    def _connection(self):
+        """Yield the request-scoped connection inside a Flask request, else a fresh pooled one.
+
+        Reusing one checkout per request skips the pool round trip and pre-ping
+        that every execute_* call would otherwise pay. The request connection runs
+        in autocommit, so reads never leave it idle in a transaction and cost no
+        BEGIN/COMMIT; transaction() opens a real one only around its block.
+        """
+        if not has_request_context():
+            with self.engine.connect() as conn:
+                yield conn
+            return
+
+        conn = g.get('_db_conn')
+        if conn is None:
+            conn = g._db_conn = self.engine.connect().execution_options(isolation_level='AUTOCOMMIT')
+        try:
+            yield conn
+        except Exception:
+            # Leave the shared connection usable for the rest of the request
+            conn.rollback()
+            raise
+
+    def _commit(self, conn):
+        """Commit a single-statement write, unless it runs inside transaction()'s block,
+        whose commit (or rollback) then covers it."""
+        if not (has_request_context() and g.get('_db_in_transaction')):
+            conn.commit()
+
+    def close_request_connection(self, exc=None):
+        """Return the request-scoped connection to the pool (teardown_appcontext hook).
+
+        Views also call it before slow non-database work (LLM calls) so the
+        checkout goes back to the pool meanwhile; a later query takes a new one.
+        """
+        conn = g.pop('_db_conn', None)
+        if conn is not None:
+            conn.close()
+
     # ── SELECT (many rows) ────────────────────────────────────────
     def execute_query(self, query, params=()):
         """Execute a SELECT and return list of dicts."""
         try:
-            pg_sql = _sqlite_to_pg(query)
-            named_sql, pdict = _to_named(pg_sql, params)
-            with self.engine.connect() as conn:
-                result = conn.execute(text(named_sql), pdict)
+            with self._connection() as conn:
+                result = conn.execute(_prepare(query), _bind(params))
                 rows = result.mappings().all()
                 return [dict(row) for row in rows]
         except Exception as e:
@@ -122,16 +238,31 @@ class DatabaseManager:
     def execute_one(self, query, params=()):
         """Execute a SELECT and return first row as dict, or None."""
         try:
-            pg_sql = _sqlite_to_pg(query)
-            named_sql, pdict = _to_named(pg_sql, params)
-            with self.engine.connect() as conn:
-                result = conn.execute(text(named_sql), pdict)
+            with self._connection() as conn:
+                result = conn.execute(_prepare(query), _bind(params))
                 row = result.mappings().first()
                 return dict(row) if row else None
         except Exception as e:
             logger.error(f"Query one error: {e}\n  SQL: {query}")
             return None
 
+    # ── SELECT (streamed) ─────────────────────────────────────────
+    def iter_query(self, query, params=(), batch_size=256):
+        """Yield rows as dicts from a server-side cursor, batch_size rows at a time.
+
+        Uses its own connection so the generator can outlive the view that
+        created it (streamed responses). Errors are logged and re-raised: a
+        half-sent stream cannot be turned into an empty result.
+        """
+        try:
+            with self.engine.connect() as conn:
+                result = conn.execution_options(yield_per=batch_size).execute(_prepare(query), _bind(params))
+                for row in result.mappings():
+                    yield dict(row)
+        except Exception as e:
+            logger.error(f"Streamed query error: {e}\n  SQL: {query}")
+            raise
+
     # ── INSERT ────────────────────────────────────────────────────
     def execute_insert(self, query, params=()):
         """Execute an INSERT and return the new row id.
@@ -139,30 +270,82 @@ class DatabaseManager:
         Auto-appends ``RETURNING id`` for PostgreSQL when not already present.
         """
         try:
-            pg_sql = _sqlite_to_pg(query)
-            # Append RETURNING id for INSERT statements
-            trimmed = pg_sql.strip().rstrip(';')
-            if trimmed.upper().startswith('INSERT') and 'RETURNING' not in trimmed.upper():
-                pg_sql = trimmed + ' RETURNING id'
-            named_sql, pdict = _to_named(pg_sql, params)
-            with self.engine.connect() as conn:
-                result = conn.execute(text(named_sql), pdict)
-                conn.commit()
+            with self._connection() as conn:
+                result = conn.execute(_prepare(query, returning_id=True), _bind(params))
+                self._commit(conn)
                 row = result.fetchone()
                 return row[0] if row else None
         except Exception as e:
             logger.error(f"Insert error: {e}\n  SQL: {query}")
             raise
 
+    # ── UPDATE … RETURNING ────────────────────────────────────────
+    def execute_returning(self, query, params=()):
+        """Execute a write with a RETURNING clause, commit, and return the first row as dict, or None."""
+        try:
+            with self._connection() as conn:
+                result = conn.execute(_prepare(query), _bind(params))
+                row = result.mappings().first()
+                self._commit(conn)
+                return dict(row) if row else None
+        except Exception as e:
+            logger.error(f"Returning error: {e}\n  SQL: {query}")
+            raise
+
+    # ── BATCH WRITE ───────────────────────────────────────────────
+    def execute_many(self, query, params_list):
+        """Execute one statement for every params tuple in a single transaction (executemany)."""
+        if not params_list:
+            return
+        with self.transaction() as tx:
+            tx.execute_many(query, params_list)
+
+    # ── MULTI-STATEMENT WRITE ─────────────────────────────────────
+    @contextmanager
+    def transaction(self, durable=True):
+        """Run several writes on one connection and commit them together.
+
+            with db.transaction() as tx:
+                tx.execute(sql, params)
+                new_id = tx.insert(sql, params)
+
+        Any exception rolls back every statement in the block. durable=False
+        commits without waiting for the WAL flush (synchronous_commit off for
+        this transaction only) — for rows that are cheap to lose in a crash.
+        """
+        in_request = has_request_context()
+        if in_request and g.get('_db_in_transaction'):
+            # Nested block: its statements join the enclosing transaction
+            yield _Transaction(g._db_conn)
+            return
+
+        with self._connection() as conn:
+            if in_request:
+                # Leave autocommit for the block; psycopg2 applies the level with the
+                # BEGIN it sends before the first statement, so this costs no round trip
+                conn.commit()
+                conn.execution_options(isolation_level=conn.default_isolation_level)
+                g._db_in_transaction = True
+            try:
+                if not durable:
+                    conn.execute(text('SET LOCAL synchronous_commit TO OFF'))
+                yield _Transaction(conn)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                if in_request:
+                    g._db_in_transaction = False
+                    conn.execution_options(isolation_level='AUTOCOMMIT')
+
     # ── UPDATE / DELETE ───────────────────────────────────────────
     def execute_update(self, query, params=()):
         """Execute UPDATE / DELETE / any non-SELECT statement."""
         try:
-            pg_sql = _sqlite_to_pg(query)
-            named_sql, pdict = _to_named(pg_sql, params)
-            with self.engine.connect() as conn:
-                conn.execute(text(named_sql), pdict)
-                conn.commit()
+            with self._connection() as conn:
+                conn.execute(_prepare(query), _bind(params))
+                self._commit(conn)
         except Exception as e:
             logger.error(f"Update error: {e}\n  SQL: {query}")
             raise
@@ -1,14 +1,19 @@
 import secrets
+import hashlib
+import hmac
 import logging
 import smtplib
 import os
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from datetime import datetime, timedelta
-from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.security import check_password_hash
 
 logger = logging.getLogger(__name__)
 
+# Keys that must never key OTP digests (unset, or config.py's public placeholder)
+_UNUSABLE_OTP_KEYS = ('', 'your-secret-key-change-in-production')
+
 # Purpose-specific email config
 _EMAIL_CONFIG = {
     'signup': {
@@ -38,6 +43,24 @@ class EmailService:
         self.smtp_password = os.environ.get('SMTP_PASSWORD', '')
         self.smtp_host = os.environ.get('SMTP_HOST', 'smtp.gmail.com')
         self.smtp_port = int(os.environ.get('SMTP_PORT', '587'))
+        # Server-side key for OTP digests, so a leaked otp table cannot be brute-forced offline;
+        # set from app config by init_app()
+        self.otp_pepper = b''
+
+    def init_app(self, app):
+        """Key OTP digests with OTP_PEPPER, else SECRET_KEY.
+
+        Without a real key, debug runs get a per-process random one (OTPs do not
+        survive a restart); anywhere else OTP hashing refuses to run.
+        """
+        key = app.config.get('OTP_PEPPER') or app.config.get('SECRET_KEY') or ''
+        if key not in _UNUSABLE_OTP_KEYS:
+            self.otp_pepper = key.encode() if isinstance(key, str) else key
+        elif app.debug:
+            logger.warning("[EMAIL] OTP_PEPPER/FLASK_SECRET_KEY not set; using a temporary OTP key")
+            self.otp_pepper = secrets.token_bytes(32)
+        else:
+            logger.error("[EMAIL] OTP_PEPPER (or FLASK_SECRET_KEY) must be set; OTPs cannot be issued or verified")
 
     def generate_otp(self, length=6):
         """Generate a cryptographically secure numeric OTP."""
@@ -46,16 +69,25 @@ class EmailService:
         return str(secrets.randbelow(upper - lower) + lower)
 
     def hash_otp(self, otp):
-        """Hash OTP for secure storage."""
-        return generate_password_hash(str(otp))
+        """Hash OTP for secure storage (HMAC-SHA256 hex digest).
+
+        OTPs expire in minutes and allow 5 attempts, so a slow password KDF only
+        burns CPU per attempt; the keyed digest keeps them safe at rest.
+        """
+        if not self.otp_pepper:
+            raise RuntimeError('OTP key not configured: set OTP_PEPPER or FLASK_SECRET_KEY')
+        return hmac.new(self.otp_pepper, str(otp).encode(), hashlib.sha256).hexdigest()
 
     def verify_otp(self, stored_hash, otp):
-        """Verify OTP against stored hash."""
-        return check_password_hash(stored_hash, str(otp))
+        """Verify OTP against stored hash in constant time."""
+        if ':' in stored_hash:
+            # werkzeug hash from before the switch; only lives until the OTP expires
+            return check_password_hash(stored_hash, str(otp))
+        return hmac.compare_digest(stored_hash, self.hash_otp(otp))
 
-    def get_otp_expiry(self, minutes=5):
-        """Return expiry timestamp (5 minutes from now)."""
-        return (datetime.now() + timedelta(minutes=minutes)).isoformat()
+    def get_otp_expiry(self, minutes=5, now=None):
+        """Return expiry timestamp (5 minutes from now) as a datetime, bound natively by the driver."""
+        return (now or datetime.now()) + timedelta(minutes=minutes)
 
     def send_otp_email(self, email, otp, purpose='password_reset'):
         """Send OTP email. Uses SMTP if configured, otherwise console fallback.
@@ -120,10 +152,8 @@ class EmailService:
                 logger.info(f"[EMAIL] {purpose} OTP sent to {email} via SMTP")
                 return True
                 
-            except Exception as e:
-                logger.error(f"[EMAIL] SMTP Delivery Failed: {e}")
-                import traceback
-                traceback.print_exc() 
+            except Exception:
+                logger.exception("[EMAIL] SMTP Delivery Failed")
                 
                 # Production safety: if not in dev mode, fail hard
                 is_dev = os.environ.get('FLASK_ENV') == 'development' or os.environ.get('FLASK_DEBUG') == '1'
@@ -148,6 +178,9 @@ class EmailService:
 email_service = EmailService()
 
 # Module-level convenience functions
+def init_app(app):
+    email_service.init_app(app)
+
 def generate_otp():
     return email_service.generate_otp()
 
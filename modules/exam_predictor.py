@@ -9,6 +9,16 @@ from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
+# Fixed suggestion cards, built once and shared (they are only serialized, never mutated)
+_SUGGEST_FUNDAMENTALS = {'icon': '🚨', 'text': 'Focus on fundamentals — review lecture notes before attempting quizzes', 'priority': 'high'}
+_SUGGEST_PRACTICE = {'icon': '📖', 'text': 'Practice more quizzes to strengthen medium-difficulty topics', 'priority': 'medium'}
+_SUGGEST_ON_TRACK = {'icon': '🎯', 'text': 'You\'re on track! Focus on mastering advanced topics for an edge', 'priority': 'low'}
+_SUGGEST_DECLINING = {'icon': '⚠️', 'text': 'Your recent scores are dropping — revisit recent topics and take breaks to avoid burnout', 'priority': 'high'}
+_SUGGEST_IMPROVING = {'icon': '🔥', 'text': 'Great momentum! Keep your current study rhythm going', 'priority': 'low'}
+_SUGGEST_CONSISTENCY = {'icon': '📊', 'text': 'Your scores vary a lot — aim for consistent daily study sessions', 'priority': 'medium'}
+_SUGGEST_MORE_QUIZZES = {'icon': '📝', 'text': 'Take more quizzes to improve prediction accuracy', 'priority': 'medium'}
+_SUGGEST_FIRST_QUIZ = {'icon': '📝', 'text': 'Complete your first quiz to get a prediction!', 'priority': 'medium'}
+
 
 class ExamPredictor:
     def __init__(self, db):
@@ -238,41 +248,19 @@ class ExamPredictor:
 
     def _generate_suggestions(self, weak_topics, predicted_score, trend, scores):
         """Generate actionable improvement suggestions."""
-        suggestions = []
-
         # Score-based suggestions
         if predicted_score < 50:
-            suggestions.append({
-                'icon': '🚨',
-                'text': 'Focus on fundamentals — review lecture notes before attempting quizzes',
-                'priority': 'high'
-            })
+            suggestions = [_SUGGEST_FUNDAMENTALS]
         elif predicted_score < 70:
-            suggestions.append({
-                'icon': '📖',
-                'text': 'Practice more quizzes to strengthen medium-difficulty topics',
-                'priority': 'medium'
-            })
+            suggestions = [_SUGGEST_PRACTICE]
         else:
-            suggestions.append({
-                'icon': '🎯',
-                'text': 'You\'re on track! Focus on mastering advanced topics for an edge',
-                'priority': 'low'
-            })
+            suggestions = [_SUGGEST_ON_TRACK]
 
         # Trend-based
         if trend == 'declining':
-            suggestions.append({
-                'icon': '⚠️',
-                'text': 'Your recent scores are dropping — revisit recent topics and take breaks to avoid burnout',
-                'priority': 'high'
-            })
+            suggestions.append(_SUGGEST_DECLINING)
         elif trend == 'improving':
-            suggestions.append({
-                'icon': '🔥',
-                'text': 'Great momentum! Keep your current study rhythm going',
-                'priority': 'low'
-            })
+            suggestions.append(_SUGGEST_IMPROVING)
 
         # Weak topic suggestions
         if weak_topics:
@@ -289,19 +277,11 @@ class ExamPredictor:
             mean = sum(score_vals) / len(score_vals)
             variance = sum((x - mean) ** 2 for x in score_vals) / len(score_vals)
             if math.sqrt(variance) > 15:
-                suggestions.append({
-                    'icon': '📊',
-                    'text': 'Your scores vary a lot — aim for consistent daily study sessions',
-                    'priority': 'medium'
-                })
+                suggestions.append(_SUGGEST_CONSISTENCY)
 
         # Volume suggestion
         if len(scores) < 5:
-            suggestions.append({
-                'icon': '📝',
-                'text': 'Take more quizzes to improve prediction accuracy',
-                'priority': 'medium'
-            })
+            suggestions.append(_SUGGEST_MORE_QUIZZES)
 
         return suggestions[:5]
 
@@ -312,11 +292,7 @@ class ExamPredictor:
             'predicted_score': 0,
             'cgpa_chance': 0,
             'weak_topics': [],
-            'suggestions': [{
-                'icon': '📝',
-                'text': 'Complete your first quiz to get a prediction!',
-                'priority': 'medium'
-            }],
+            'suggestions': [_SUGGEST_FIRST_QUIZ],
             'trend_direction': 'stable',
             'quiz_count_used': 0,
             'created_at': None
@@ -0,0 +1,28 @@
+"""
+OrjsonProvider — Flask JSON provider backed by orjson.
+Keeps Flask's wire format (sorted keys, RFC 822 dates, Decimal/UUID as
+strings) while serializing straight to bytes in the C extension.
+"""
+import orjson
+from flask.json.provider import DefaultJSONProvider
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    # Datetimes are passed through to Flask's default() so dates keep the HTTP-date format;
+    # NumPy scalars/arrays from the analytics code serialize natively
+    options = (orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+               | orjson.OPT_SERIALIZE_NUMPY)
+
+    def dumps_bytes(self, obj):
+        return orjson.dumps(obj, default=self.default, option=self.options)
+
+    def dumps(self, obj, **kwargs):
+        return self.dumps_bytes(obj).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        """Build the JSON response from bytes, skipping the str round trip."""
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self.dumps_bytes(obj) + b'\n', mimetype=self.mimetype)
@@ -1,8 +1,8 @@
 import os
 import requests
 import logging
-import markdown
-from markdown.extensions import fenced_code, tables, nl2br
+import threading
+from functools import lru_cache
 
 logger = logging.getLogger(__name__)
 
@@ -225,31 +225,37 @@ I'd love to provide you with detailed expert guidance, but I need to be configur
         """Convert markdown to HTML with syntax highlighting support"""
         if not text:
             return ""
-        
-        # Configure markdown extensions
-        extensions = [
-            'fenced_code',
-            'tables',
-            'nl2br',
-            'codehilite',
-            'extra'
-        ]
-        
-        extension_configs = {
-            'codehilite': {
-                'css_class': 'highlight',
-                'linenums': False
+        return _render_markdown_cached(text)
+
+
+# Markdown instances are not thread-safe, so each worker thread builds one (extensions
+# loaded once) and reset()s it per document instead of markdown.markdown() rebuilding it
+_md_local = threading.local()
+
+
+def _markdown_renderer():
+    md = getattr(_md_local, 'md', None)
+    if md is None:
+        # Imported on first render, not at app import: only the AI paths need markdown
+        import markdown
+        md = _md_local.md = markdown.Markdown(
+            extensions=['fenced_code', 'tables', 'nl2br', 'codehilite', 'extra'],
+            extension_configs={
+                'codehilite': {
+                    'css_class': 'highlight',
+                    'linenums': False
+                }
             }
-        }
-        
-        try:
-            html = markdown.markdown(
-                text,
-                extensions=extensions,
-                extension_configs=extension_configs
-            )
-            return html
-        except Exception as e:
-            logger.error(f"Markdown rendering error: {e}")
-            # Fallback: return text with basic formatting
-            return text.replace('\n', '<br>')
+        )
+    return md
+
+
+# Identical answers (stock questions, re-read chat history) skip the markdown tree walk
+@lru_cache(maxsize=1024)
+def _render_markdown_cached(text):
+    try:
+        return _markdown_renderer().reset().convert(text)
+    except Exception as e:
+        logger.error(f"Markdown rendering error: {e}")
+        # Fallback: return text with basic formatting
+        return text.replace('\n', '<br>')
@@ -0,0 +1,114 @@
+"""
+TTLCache — Small thread-safe in-process cache with per-entry expiry.
+Used to absorb repeated identical reads (dashboards, analytics polls)
+for a few seconds instead of re-running the same SQL.
+
+RedisTTLCache offers the same get/set/pop/clear API on a shared Redis
+for entries every worker must agree on (e.g. anything holding a password hash).
+"""
+import threading
+import time
+
+import orjson
+
+
+class TTLCache:
+    def __init__(self, ttl=30, maxsize=256):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """Return the cached value for key, or default if missing/expired."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+            return value
+
+    def set(self, key, value):
+        """Store value under key for `ttl` seconds."""
+        with self._lock:
+            if len(self._data) >= self.maxsize and key not in self._data:
+                self._evict()
+            self._data[key] = (time.monotonic() + self.ttl, value)
+
+    def get_or_set(self, key, factory):
+        """Return the cached value, computing and storing it via factory() on a miss."""
+        value = self.get(key)
+        if value is None:
+            value = factory()
+            if value is not None:
+                self.set(key, value)
+        return value
+
+    def incr(self, key, ttl=None):
+        """Atomically add 1 to key's counter and return it; a new counter expires after ttl (default self.ttl)."""
+        with self._lock:
+            now = time.monotonic()
+            entry = self._data.get(key)
+            if entry is None or entry[0] <= now:
+                if len(self._data) >= self.maxsize and key not in self._data:
+                    self._evict()
+                entry = (now + (ttl or self.ttl), 0)
+            self._data[key] = (entry[0], entry[1] + 1)
+            return entry[1] + 1
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, None)
+            return entry[1] if entry else default
+
+    def pop_where(self, predicate):
+        """Drop every entry whose key satisfies predicate(key)."""
+        with self._lock:
+            for key in [k for k in self._data if predicate(k)]:
+                del self._data[key]
+
+    def pop_prefix(self, prefix):
+        """Drop every tuple key whose first element is prefix, e.g. all ('available', user_id) entries."""
+        self.pop_where(lambda k: isinstance(k, tuple) and k and k[0] == prefix)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def _evict(self):
+        """Drop expired entries; if still full, drop the entry closest to expiry."""
+        now = time.monotonic()
+        expired = [k for k, (exp, _) in self._data.items() if exp <= now]
+        for k in expired:
+            del self._data[k]
+        if len(self._data) >= self.maxsize:
+            oldest = min(self._data, key=lambda k: self._data[k][0])
+            del self._data[oldest]
+
+
+class RedisTTLCache:
+    """TTLCache-compatible cache stored in Redis under key_prefix; values are JSON-encoded."""
+
+    def __init__(self, client, key_prefix, ttl=30):
+        self.client = client
+        self.key_prefix = key_prefix
+        self.ttl = ttl
+
+    def get(self, key, default=None):
+        raw = self.client.get(self.key_prefix + str(key))
+        return default if raw is None else orjson.loads(raw)
+
+    def set(self, key, value):
+        self.client.set(self.key_prefix + str(key), orjson.dumps(value), ex=self.ttl)
+
+    def pop(self, key, default=None):
+        raw = self.client.getdel(self.key_prefix + str(key))
+        return default if raw is None else orjson.loads(raw)
+
+    def clear(self):
+        keys = list(self.client.scan_iter(match=self.key_prefix + '*', count=500))
+        if keys:
+            self.client.delete(*keys)
@@ -168,9 +168,9 @@ def student_learning_summary():
             }
         })
 
-    except Exception as e:
+    except Exception:
         logger.exception('Error building learning summary')
-        return jsonify({'success': False, 'error': str(e)}), 500
+        return jsonify({'success': False, 'error': 'Error building learning summary'}), 500
 
 
 # ─── TUTOR RESPOND API ──────────────────────────────────────
@@ -289,9 +289,9 @@ def tutor_respond():
             'recommended_actions': recommended_actions
         })
 
-    except Exception as e:
+    except Exception:
         logger.exception('Error in tutor respond')
-        return jsonify({'success': False, 'error': str(e)}), 500
+        return jsonify({'success': False, 'error': 'Error in tutor respond'}), 500
 
 
 # ─── MARK MODULE COMPLETE ───────────────────────────────────
@@ -347,9 +347,9 @@ def mark_module_complete():
 
         return jsonify({'success': True, 'message': 'Module marked as complete'})
 
-    except Exception as e:
+    except Exception:
         logger.exception('Error marking module complete')
-        return jsonify({'success': False, 'error': str(e)}), 500
+        return jsonify({'success': False, 'error': 'Error marking module complete'}), 500
 
 
 # ─── TUTOR CHAT HISTORY ─────────────────────────────────────
@@ -372,9 +372,9 @@ def tutor_chat_history():
         history.reverse()
 
         return jsonify({'success': True, 'history': history})
-    except Exception as e:
+    except Exception:
         logger.exception('Error fetching tutor history')
-        return jsonify({'success': False, 'error': str(e)}), 500
+        return jsonify({'success': False, 'error': 'Error fetching tutor history'}), 500
 
 
 # ─── CLEAR CHAT MEMORY ─────────────────────────────────────
@@ -387,9 +387,9 @@ def clear_chat_memory():
     try:
         _db.execute_update('DELETE FROM chat_memory WHERE student_id = ?', (user_id,))
         return jsonify({'success': True, 'message': 'Chat memory cleared'})
-    except Exception as e:
+    except Exception:
         logger.exception('Error clearing chat memory')
-        return jsonify({'success': False, 'error': str(e)}), 500
+        return jsonify({'success': False, 'error': 'Error clearing chat memory'}), 500
 
 
 # ─── WEAK TOPICS SUMMARY ───────────────────────────────────
@@ -425,9 +425,9 @@ def weak_topics_summary():
                 'avg_score': context.get('avg_score', 0)
             }
         })
-    except Exception as e:
+    except Exception:
         logger.exception('Error building weak summary')
-        return jsonify({'success': False, 'error': str(e)}), 500
+        return jsonify({'success': False, 'error': 'Error building weak summary'}), 500
 
 
 # ═══════════════════════════════════════════════════════════
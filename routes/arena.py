@@ -707,11 +707,9 @@ def arena_dashboard():
         
         achievements = _db.execute_query('SELECT * FROM arena_achievements WHERE student_id=? ORDER BY unlocked_at DESC LIMIT 5', (uid,))
     
-    except Exception as e:
-        import traceback
-        traceback.print_exc()
-        error_msg = str(e)
-        logger.error(f"Arena Dashboard Error: {e}")
+    except Exception:
+        logger.exception("Arena Dashboard Error")
+        error_msg = 'Some arena data could not be loaded. Please refresh in a moment.'
         # Even on error, we try to pass defaults
 
     return render_template('arena/arena_dashboard.html',
@@ -992,7 +990,6 @@ def leaderboard_api():
 
 @arena_bp.route('/arena/submit_attempt', methods=['POST'])
 def submit_attempt():
-    import traceback
     try:
         uid = _require_student()
         if uid in ('NO_AUTH', 'WRONG_ROLE'):
@@ -1145,10 +1142,9 @@ def submit_attempt():
 
         return jsonify({'success': True, 'redirect': url_for('arena.session_result', session_id=session_id)})
     
-    except Exception as e:
-        traceback.print_exc()
-        logger.error(f"Submit attempt error: {e}")
-        return jsonify({'success': False, 'error': f"Internal Error: {str(e)}"}), 500
+    except Exception:
+        logger.exception("Submit attempt error")
+        return jsonify({'success': False, 'error': 'Internal Error'}), 500
 
 @arena_bp.route('/arena/review/<int:session_id>')
 def review_attempt(session_id):
@@ -2,20 +2,148 @@
 Authentication Blueprint for LearnVaultX
 Handles login, registration, OTP verification, and password resets.
 """
-from flask import Blueprint, request, jsonify, session, render_template, redirect, url_for
+from flask import Blueprint, request, jsonify, session, render_template, redirect, url_for, Response, current_app
 from datetime import datetime
+from urllib.parse import urlparse
 import os
+import time
 
 auth_bp = Blueprint('auth', __name__)
 
 from app import (
     db, email_service, logger, rate_limit, get_json_payload, 
     json_error, json_success, validate_email, validate_password, 
-    sanitize_input, hash_password, verify_password
+    sanitize_input, hash_password, verify_password, login_cache, conditional,
+    email_executor, DUMMY_PASSWORD_HASH, otp_cooldown
 )
 
 
+def _load_login_user(email):
+    """Fetch the columns api_login needs; verified rows are cached per email."""
+    user = login_cache.get(email)
+    if user is None:
+        user = db.execute_one(
+            'SELECT id, name, email, role, password_hash, is_verified FROM users WHERE email = ?',
+            (email,)
+        )
+        # Unverified rows are replaced on re-signup and flipped by OTP verification, so never cache them
+        if user and user.get('is_verified'):
+            login_cache.set(email, user)
+    return user
+
+
+# Retire the email's unused codes and store the new one in a single statement (one round
+# trip); the INSERT does not see the UPDATE's snapshot, so the fresh row stays live
+SQL_ROTATE_OTP = '''
+    WITH retired AS (
+        UPDATE otp_requests SET is_used = 1 WHERE email = ? AND otp_type = ? AND is_used = 0
+    )
+    INSERT INTO otp_requests (email, otp_hash, otp_type, created_at, expires_at) VALUES (?, ?, ?, ?, ?)
+'''
+SQL_ROTATE_RESET_OTP = '''
+    WITH retired AS (
+        UPDATE password_reset_otp SET used = 1 WHERE email = ? AND used = 0
+    )
+    INSERT INTO password_reset_otp (email, otp, created_at, expires_at, used, attempts) VALUES (?, ?, ?, ?, 0, 0)
+'''
+
+
+def _new_otp():
+    """Return (otp, otp_hash, created_at, expires_at) for a freshly generated code."""
+    otp = email_service.generate_otp()
+    # created_at comes from the same clock as expires_at and the cooldown/expiry checks
+    created_at = datetime.now()
+    return otp, email_service.hash_otp(otp), created_at, email_service.get_otp_expiry(now=created_at)
+
+
+def _rotate_otp(tx, email, otp_type):
+    """Inside transaction tx, retire the email's unused OTPs of otp_type and store a fresh one.
+
+    Returns the plain OTP to email out.
+    """
+    otp, otp_hash, created_at, expires_at = _new_otp()
+    tx.execute(SQL_ROTATE_OTP, (email, otp_type, email, otp_hash, otp_type, created_at, expires_at))
+    return otp
+
+
+def _rotate_reset_otp(tx, email):
+    """Password-reset counterpart of _rotate_otp (password_reset_otp table)."""
+    otp, otp_hash, created_at, expires_at = _new_otp()
+    tx.execute(SQL_ROTATE_RESET_OTP, (email, email, otp_hash, created_at, expires_at))
+    return otp
+
+
+# Expired rows are filtered here (and purged by the background sweep); the fifth attempt
+# also retires the row (a correct code is marked used right after), so failures need no
+# follow-up write and concurrent guesses cannot reuse a stale attempt count
+SQL_CLAIM_OTP = '''
+    UPDATE otp_requests SET attempts = COALESCE(attempts, 0) + 1,
+           is_used = CASE WHEN COALESCE(attempts, 0) + 1 >= 5 THEN 1 ELSE is_used END
+    WHERE id = (SELECT id FROM otp_requests
+                WHERE email = ? AND otp_type = ? AND is_used = 0 AND expires_at > ?
+                ORDER BY created_at DESC LIMIT 1)
+    RETURNING id, otp_hash, attempts
+'''
+db.prepare(SQL_ROTATE_OTP, SQL_ROTATE_RESET_OTP, SQL_CLAIM_OTP)
+
+OTP_RESEND_COOLDOWN = 60  # seconds between OTP emails of one purpose to one address
+
+
+def _otp_cooldown_left(purpose, email):
+    """Whole seconds until another `purpose` OTP may be sent to email; 0 when allowed."""
+    sent_at = otp_cooldown.get(f'{purpose}:{email}')
+    if sent_at is None:
+        return 0
+    return max(0, int(OTP_RESEND_COOLDOWN - (time.time() - sent_at)))
+
+
+def _start_otp_cooldown(purpose, email):
+    """Record that a `purpose` OTP was (or, for unknown reset addresses, appears to be) sent now."""
+    otp_cooldown.set(f'{purpose}:{email}', time.time())
+
+
+# OTP guesses allowed per email across all clients; together with the per-code
+# attempt cap and the resend cooldown this bounds brute force from rotating IPs
+OTP_VERIFY_CALLS_PER_EMAIL = 10
+OTP_VERIFY_WINDOW = 15 * 60
+
+
+def _session_email_bucket(session_key):
+    """rate_limit(by=...) bucket for the email an OTP flow keeps in session[session_key]."""
+    def bucket():
+        email = session.get(session_key)
+        return f'email:{email}' if email else None
+    return bucket
+
+
+def _post_login_redirect(next_url, role):
+    """Path-only part of next_url (e.g. /arena) when it is a local path, else the role's dashboard."""
+    # Handle both full URLs and relative paths; keep just the path for safety
+    safe_next = urlparse(next_url).path if next_url else ''
+    if safe_next.startswith('/'):
+        return safe_next
+    return '/teacher/dashboard' if role == 'teacher' else '/student/dashboard'
+
+
+def _queue_otp_email(email, otp, purpose, tag):
+    """Send the OTP email on email_executor and log failures; the response does not wait on SMTP."""
+    def _report(future):
+        try:
+            sent = future.result()
+        except Exception:
+            logger.exception(f"[{tag}] Error sending {purpose} OTP to {email}")
+            return
+        if sent:
+            logger.info(f"[{tag}] {purpose} OTP sent to {email}")
+        else:
+            logger.error(f"[{tag}] Failed to send {purpose} OTP to {email}")
+
+    _start_otp_cooldown(purpose, email)
+    email_executor.submit(email_service.send_otp_email, email, otp, purpose).add_done_callback(_report)
+
+
 @auth_bp.route('/')
+@conditional
 def index():
     if 'user_id' in session:
         if session['role'] == 'teacher':
@@ -24,6 +152,7 @@ def index():
     return render_template('home.html')
 
 @auth_bp.route('/login', methods=['GET', 'POST'])
+@conditional
 def login():
     next_url = request.args.get('next', '')
     if request.method == 'POST':
@@ -43,10 +172,14 @@ def api_login():
     if not email or not password:
         return json_error('Email and password required', status=400)
 
-    user = db.execute_one('SELECT * FROM users WHERE email = ?', (email,))
+    user = _load_login_user(email)
     logger.info(f"[LOGIN] User lookup for {email}: Found={user is not None}")
 
-    if not user or not verify_password(user['password_hash'], password, user_id=user['id']):
+    if not user:
+        # Same hashing work as a real account, so response time does not reveal which emails exist
+        verify_password(DUMMY_PASSWORD_HASH, password)
+        return json_error('Invalid credentials', status=401)
+    if not verify_password(user['password_hash'], password, user_id=user['id'], email=email):
         return json_error('Invalid credentials', status=401)
 
     # Check if user is verified
@@ -64,19 +197,7 @@ def api_login():
     session['email'] = user['email']
 
     # Honor next parameter for post-login redirect (e.g. /arena)
-    next_url = data.get('next', '')
-    # Handle both full URLs and relative paths
-    if next_url:
-        from urllib.parse import urlparse
-        parsed = urlparse(next_url)
-        # Extract just the path portion for safety
-        safe_next = parsed.path if parsed.path else ''
-        if safe_next and safe_next.startswith('/'):
-            redirect_url = safe_next
-        else:
-            redirect_url = '/teacher/dashboard' if user['role'] == 'teacher' else '/student/dashboard'
-    else:
-        redirect_url = '/teacher/dashboard' if user['role'] == 'teacher' else '/student/dashboard'
+    redirect_url = _post_login_redirect(data.get('next', ''), user['role'])
     logger.info(f"[LOGIN] User {email} logged in successfully (OTP bypassed), redirect={redirect_url}")
     
     return jsonify({
@@ -87,6 +208,7 @@ def api_login():
     }), 200
 
 @auth_bp.route('/register', methods=['GET'])
+@conditional
 def register():
     return render_template('register.html')
 
@@ -116,48 +238,43 @@ def api_register():
 
     # Check if user exists
     existing = db.execute_one('SELECT id, is_verified FROM users WHERE email = ?', (email,))
-    if existing:
-        if existing.get('is_verified'):
-            return json_error('Email already registered', status=400)
-        else:
-            # Unverified user re-signing up — delete old record so they can re-register
-            db.execute_update('DELETE FROM users WHERE email = ? AND is_verified = 0', (email,))
+    if existing and existing.get('is_verified'):
+        return json_error('Email already registered', status=400)
 
-    # Create user as UNVERIFIED
     password_hash = hash_password(password)
-    logger.info(f"[REGISTER] Creating unverified user {email}")
-    user_id = db.execute_insert(
-        'INSERT INTO users (name, email, password_hash, role, is_verified) VALUES (?, ?, ?, ?, 0)',
-        (name, email, password_hash, role)
-    )
-
-    # Generate and send signup OTP
-    otp = email_service.generate_otp()
-    otp_hash = email_service.hash_otp(otp)
-    expires_at = email_service.get_otp_expiry()
 
-    # Invalidate old signup OTPs
-    db.execute_update(
-        "UPDATE otp_requests SET is_used = 1 WHERE email = ? AND otp_type = 'signup' AND is_used = 0",
-        (email,)
-    )
+    if not current_app.config['OTP_REQUIRED_SIGNUP']:
+        # No email step: one write creates the account already verified
+        logger.info(f"[REGISTER] Creating verified user {email} (signup OTP disabled)")
+        with db.transaction() as tx:
+            if existing:
+                tx.execute('DELETE FROM users WHERE email = ? AND is_verified = 0', (email,))
+            tx.execute(
+                'INSERT INTO users (name, email, password_hash, role, is_verified, verified_at) VALUES (?, ?, ?, ?, 1, ?)',
+                (name, email, password_hash, role, datetime.now())
+            )
+        return json_success('Account created. You can now log in.', redirect='/login')
 
-    db.execute_insert(
-        'INSERT INTO otp_requests (email, otp_hash, otp_type, expires_at) VALUES (?, ?, ?, ?)',
-        (email, otp_hash, 'signup', expires_at)
-    )
+    logger.info(f"[REGISTER] Creating unverified user {email}")
+    with db.transaction() as tx:
+        if existing:
+            # Unverified user re-signing up — delete old record so they can re-register
+            tx.execute('DELETE FROM users WHERE email = ? AND is_verified = 0', (email,))
+        # Create user as UNVERIFIED, then replace any pending signup OTPs
+        user_id = tx.insert(
+            'INSERT INTO users (name, email, password_hash, role, is_verified) VALUES (?, ?, ?, ?, 0)',
+            (name, email, password_hash, role)
+        )
+        otp = _rotate_otp(tx, email, 'signup')
 
-    email_sent = email_service.send_otp_email(email, otp, purpose='signup')
-    if not email_sent:
-        logger.error(f"[REGISTER] Failed to send signup OTP to {email}")
-        return json_error('Failed to send OTP email. Please try again later.', status=500)
+    _queue_otp_email(email, otp, 'signup', 'REGISTER')
 
     # Store signup context in session
     session['signup_otp_email'] = email
     session['signup_otp_user_id'] = user_id
     session.pop('user_id', None)
 
-    logger.info(f"[REGISTER] Signup OTP sent to {email}")
+    logger.info(f"[REGISTER] Signup OTP queued for {email}")
     return jsonify({
         'success': True,
         'message': 'OTP sent to your email for verification',
@@ -177,6 +294,7 @@ def verify_signup_otp_page():
 
 @auth_bp.route('/api/verify-signup-otp', methods=['POST'])
 @rate_limit(calls=10, period=120)
+@rate_limit(calls=OTP_VERIFY_CALLS_PER_EMAIL, period=OTP_VERIFY_WINDOW, by=_session_email_bucket('signup_otp_email'))
 def api_verify_signup_otp():
     """Verify signup OTP and activate user account."""
     data = get_json_payload()
@@ -191,47 +309,27 @@ def api_verify_signup_otp():
     if not otp or len(otp) != 6:
         return json_error('Please enter a valid 6-digit OTP', status=400)
 
-    # Get latest unused signup OTP
-    otp_record = db.execute_one(
-        "SELECT * FROM otp_requests WHERE email = ? AND otp_type = 'signup' AND is_used = 0 ORDER BY created_at DESC LIMIT 1",
-        (email,)
-    )
+    # Claim the latest live signup OTP and count this attempt in one statement
+    now = datetime.now()
+    otp_record = db.execute_returning(SQL_CLAIM_OTP, (email, 'signup', now))
 
     if not otp_record:
-        return json_error('No active OTP found. Please request a new one.', status=400)
-
-    # Check attempts
-    attempts = otp_record.get('attempts', 0) or 0
-    if attempts >= 5:
-        db.execute_update('UPDATE otp_requests SET is_used = 1 WHERE id = ?', (otp_record['id'],))
-        return json_error('Too many attempts. Please sign up again.', status=429)
-
-    # Check expiry
-    try:
-        expires_at = datetime.fromisoformat(str(otp_record['expires_at']))
-        if datetime.now() > expires_at:
-            db.execute_update('UPDATE otp_requests SET is_used = 1 WHERE id = ?', (otp_record['id'],))
-            return json_error('OTP has expired. Please request a new one.', status=400)
-    except (ValueError, TypeError):
-        return json_error('OTP record invalid. Please sign up again.', status=400)
-
-    # Increment attempts
-    db.execute_update('UPDATE otp_requests SET attempts = ? WHERE id = ?', (attempts + 1, otp_record['id']))
+        return json_error('No active OTP found or it has expired. Please request a new one.', status=400)
 
     # Verify OTP hash
+    attempts = otp_record['attempts']
     if not email_service.verify_otp(otp_record['otp_hash'], otp):
-        remaining = 4 - attempts
+        remaining = 5 - attempts
         if remaining > 0:
             return json_error(f'Incorrect OTP. {remaining} attempt(s) remaining.', status=400)
         else:
-            db.execute_update('UPDATE otp_requests SET is_used = 1 WHERE id = ?', (otp_record['id'],))
             return json_error('Too many failed attempts. Please sign up again.', status=429)
 
     # OTP verified — activate user
     db.execute_update('UPDATE otp_requests SET is_used = 1 WHERE id = ?', (otp_record['id'],))
     db.execute_update(
         'UPDATE users SET is_verified = 1, verified_at = ? WHERE email = ?',
-        (datetime.now().isoformat(), email)
+        (now, email)
     )
 
     # Clear signup session
@@ -250,29 +348,14 @@ def resend_signup_otp():
         return json_error('Session expired. Please sign up again.', status=400)
 
     # 60s cooldown
-    last = db.execute_one(
-        "SELECT created_at FROM otp_requests WHERE email = ? AND otp_type = 'signup' ORDER BY created_at DESC LIMIT 1",
-        (email,)
-    )
-    if last:
-        try:
-            elapsed = (datetime.now() - datetime.fromisoformat(str(last['created_at']))).total_seconds()
-            if elapsed < 60:
-                return json_error(f'Please wait {int(60 - elapsed)} seconds before resending', status=429)
-        except (ValueError, TypeError):
-            pass
+    wait = _otp_cooldown_left('signup', email)
+    if wait:
+        return json_error(f'Please wait {wait} seconds before resending', status=429)
 
     # Invalidate old + send new
-    db.execute_update("UPDATE otp_requests SET is_used = 1 WHERE email = ? AND otp_type = 'signup' AND is_used = 0", (email,))
-    otp = email_service.generate_otp()
-    otp_hash = email_service.hash_otp(otp)
-    expires_at = email_service.get_otp_expiry()
-    db.execute_insert('INSERT INTO otp_requests (email, otp_hash, otp_type, expires_at) VALUES (?, ?, ?, ?)',
-                      (email, otp_hash, 'signup', expires_at))
-    email_sent = email_service.send_otp_email(email, otp, purpose='signup')
-    if not email_sent:
-        return json_error('Failed to send email', status=500)
-    logger.info(f"[REGISTER] Resent signup OTP to {email}")
+    with db.transaction(durable=False) as tx:
+        otp = _rotate_otp(tx, email, 'signup')
+    _queue_otp_email(email, otp, 'signup', 'REGISTER')
     return json_success('New OTP sent to your email')
 
 # ============================================================================
@@ -288,6 +371,7 @@ def verify_login_otp_page():
 
 @auth_bp.route('/api/verify-login-otp', methods=['POST'])
 @rate_limit(calls=10, period=120)
+@rate_limit(calls=OTP_VERIFY_CALLS_PER_EMAIL, period=OTP_VERIFY_WINDOW, by=_session_email_bucket('login_otp_email'))
 def api_verify_login_otp():
     """Verify login OTP and create session."""
     data = get_json_payload()
@@ -302,40 +386,20 @@ def api_verify_login_otp():
     if not otp or len(otp) != 6:
         return json_error('Please enter a valid 6-digit OTP', status=400)
 
-    # Get latest unused login OTP
-    otp_record = db.execute_one(
-        "SELECT * FROM otp_requests WHERE email = ? AND otp_type = 'login' AND is_used = 0 ORDER BY created_at DESC LIMIT 1",
-        (email,)
-    )
+    # Claim the latest live login OTP and count this attempt in one statement
+    now = datetime.now()
+    otp_record = db.execute_returning(SQL_CLAIM_OTP, (email, 'login', now))
 
     if not otp_record:
-        return json_error('No active OTP found. Please log in again.', status=400)
-
-    # Check attempts
-    attempts = otp_record.get('attempts', 0) or 0
-    if attempts >= 5:
-        db.execute_update('UPDATE otp_requests SET is_used = 1 WHERE id = ?', (otp_record['id'],))
-        return json_error('Too many attempts. Please log in again.', status=429)
-
-    # Check expiry
-    try:
-        expires_at = datetime.fromisoformat(str(otp_record['expires_at']))
-        if datetime.now() > expires_at:
-            db.execute_update('UPDATE otp_requests SET is_used = 1 WHERE id = ?', (otp_record['id'],))
-            return json_error('OTP has expired. Please log in again.', status=400)
-    except (ValueError, TypeError):
-        return json_error('OTP record invalid. Please log in again.', status=400)
-
-    # Increment attempts
-    db.execute_update('UPDATE otp_requests SET attempts = ? WHERE id = ?', (attempts + 1, otp_record['id']))
+        return json_error('No active OTP found or it has expired. Please log in again.', status=400)
 
     # Verify OTP hash
+    attempts = otp_record['attempts']
     if not email_service.verify_otp(otp_record['otp_hash'], otp):
-        remaining = 4 - attempts
+        remaining = 5 - attempts
         if remaining > 0:
             return json_error(f'Incorrect OTP. {remaining} attempt(s) remaining.', status=400)
         else:
-            db.execute_update('UPDATE otp_requests SET is_used = 1 WHERE id = ?', (otp_record['id'],))
             return json_error('Too many failed attempts. Please log in again.', status=429)
 
     # OTP verified — create login session
@@ -357,16 +421,7 @@ def api_verify_login_otp():
         session.pop(key, None)
 
     # Honor next parameter for post-login redirect (e.g. /arena)
-    if next_url:
-        from urllib.parse import urlparse
-        parsed = urlparse(next_url)
-        safe_next = parsed.path if parsed.path else ''
-        if safe_next and safe_next.startswith('/'):
-            redirect_url = safe_next
-        else:
-            redirect_url = '/teacher/dashboard' if role == 'teacher' else '/student/dashboard'
-    else:
-        redirect_url = '/teacher/dashboard' if role == 'teacher' else '/student/dashboard'
+    redirect_url = _post_login_redirect(next_url, role)
     logger.info(f"[LOGIN] Login OTP verified for {email}, redirecting to {redirect_url}")
     return jsonify({
         'success': True,
@@ -384,30 +439,14 @@ def resend_login_otp():
         return json_error('Session expired. Please log in again.', status=400)
 
     # 60s cooldown
-    last = db.execute_one(
-        "SELECT created_at FROM otp_requests WHERE email = ? AND otp_type = 'login' ORDER BY created_at DESC LIMIT 1",
-        (email,)
-    )
-    if last:
-        try:
-            elapsed = (datetime.now() - datetime.fromisoformat(str(last['created_at']))).total_seconds()
-            if elapsed < 60:
-                return json_error(f'Please wait {int(60 - elapsed)} seconds before resending', status=429)
-        except (ValueError, TypeError):
-            pass
+    wait = _otp_cooldown_left('login', email)
+    if wait:
+        return json_error(f'Please wait {wait} seconds before resending', status=429)
 
     # Invalidate old + send new
-    db.execute_update("UPDATE otp_requests SET is_used = 1 WHERE email = ? AND otp_type = 'login' AND is_used = 0", (email,))
-    otp = email_service.generate_otp()
-    otp_hash = email_service.hash_otp(otp)
-    expires_at = email_service.get_otp_expiry()
-    db.execute_insert('INSERT INTO otp_requests (email, otp_hash, otp_type, expires_at) VALUES (?, ?, ?, ?)',
-                      (email, otp_hash, 'login', expires_at))
-    email_sent = email_service.send_otp_email(email, otp, purpose='login')
-    if not email_sent:
-        logger.error(f"[LOGIN] Failed to resend login OTP to {email}")
-        return json_error('Failed to send email. Please try again later.', status=500)
-    logger.info(f"[LOGIN] Resent login OTP to {email}")
+    with db.transaction(durable=False) as tx:
+        otp = _rotate_otp(tx, email, 'login')
+    _queue_otp_email(email, otp, 'login', 'LOGIN')
     return json_success('New OTP sent to your email')
 
 @auth_bp.route('/logout')
@@ -427,21 +466,32 @@ def health_check():
 
 
 
+SPEED_TEST_CHUNK = 64 * 1024
+
+
+def _random_chunks(remaining):
+    """Yield `remaining` random bytes, one SPEED_TEST_CHUNK at a time."""
+    while remaining > 0:
+        n = min(SPEED_TEST_CHUNK, remaining)
+        yield os.urandom(n)
+        remaining -= n
+
+
 @auth_bp.route('/api/speed-test')
 def speed_test():
     """Returns random data for speed testing."""
     try:
         size = int(request.args.get('size', 50000)) # Default 50KB
-        if size > 5000000: # Max 5MB
-            size = 5000000
-        # Generate random bytes efficiently
-        data = os.urandom(size)
-        return data, 200, {
-            'Content-Type': 'application/octet-stream',
-            'Cache-Control': 'no-store, no-cache, must-revalidate, max-age=0'
-        }
-    except Exception as e:
-        return jsonify({'error': str(e)}), 400
+    except (TypeError, ValueError):
+        return jsonify({'error': 'size must be an integer'}), 400
+    if size < 0:
+        return jsonify({'error': 'size must be non-negative'}), 400
+    size = min(size, 5000000) # Max 5MB
+    # Streamed so only one chunk is held in memory and the client starts receiving at once
+    return Response(_random_chunks(size), mimetype='application/octet-stream', headers={
+        'Content-Length': str(size),
+        'Cache-Control': 'no-store, no-cache, must-revalidate, max-age=0'
+    })
 
 @auth_bp.route('/test-connection')
 def test_connection():
@@ -489,68 +539,45 @@ def send_password_reset_otp():
         if not email or not validate_email(email):
             return json_error('Valid email address required', status=400)
 
+        # Security: don't reveal whether email exists — every outcome below returns
+        # this same reply and session state, and none waits on SMTP
+        session['reset_email'] = email
+        session.pop('otp_verified', None)
+        generic_reply = json_success('If this email is registered, an OTP has been sent.')
+
+        # Rate-limit: prevent spam — the OTP sent under a minute ago is still valid
+        if _otp_cooldown_left('password_reset', email):
+            logger.info(f"[FORGOT-PW] Cooldown active for {email}; not resending")
+            return generic_reply
+        # Unknown addresses get the same cooldown, so resend-otp's 429 does not reveal
+        # which emails are registered
+        _start_otp_cooldown('password_reset', email)
+
         # Check if user exists
         user = db.execute_one('SELECT id FROM users WHERE email = ?', (email,))
         if not user:
             logger.info(f"[FORGOT-PW] Email not found in DB: {email}")
-            # Security: don't reveal whether email exists
-            return json_success('If this email is registered, an OTP has been sent.')
+            return generic_reply
 
         logger.info(f"[FORGOT-PW] User found for {email}")
 
-        # Rate-limit: prevent spam — check last OTP sent time
-        last_otp = db.execute_one(
-            'SELECT created_at FROM password_reset_otp WHERE email = ? ORDER BY created_at DESC LIMIT 1',
-            (email,)
-        )
-        if last_otp:
-            try:
-                last_time = datetime.fromisoformat(str(last_otp['created_at']))
-                if (datetime.now() - last_time).total_seconds() < 60:
-                    return json_error('Please wait before requesting another OTP', status=429)
-            except (ValueError, TypeError):
-                pass  # Proceed if timestamp parsing fails
-
-        # Generate OTP
-        otp = email_service.generate_otp()
-        otp_hash = email_service.hash_otp(otp)
-        expires_at = email_service.get_otp_expiry()
-        logger.info(f"[FORGOT-PW] OTP generated for {email}")
-
-        # Invalidate old OTPs for this email
-        db.execute_update(
-            'UPDATE password_reset_otp SET used = 1 WHERE email = ? AND used = 0',
-            (email,)
-        )
-
-        # Store hashed OTP
-        db.execute_insert(
-            'INSERT INTO password_reset_otp (email, otp, expires_at, used, attempts) VALUES (?, ?, ?, 0, 0)',
-            (email, otp_hash, expires_at)
-        )
+        # Invalidate old OTPs for this email and store the hashed new one (one statement)
+        with db.transaction(durable=False) as tx:
+            otp = _rotate_reset_otp(tx, email)
         logger.info(f"[FORGOT-PW] OTP stored in DB for {email}")
 
         # Send email (real SMTP or console fallback)
-        logger.info(f"[FORGOT-PW] Sending OTP email to {email}...")
-        if email_service.send_otp_email(email, otp):
-            # Store email in session for flow continuity
-            session['reset_email'] = email
-            session.pop('otp_verified', None)
-            logger.info(f"[FORGOT-PW] OTP email sent successfully to {email}")
-            return json_success('OTP sent to your email address')
-        else:
-            logger.error(f"[FORGOT-PW] Failed to send OTP email to {email}")
-            return json_error('Failed to send email. Please check SMTP configuration or try again later.', status=500)
+        _queue_otp_email(email, otp, 'password_reset', 'FORGOT-PW')
+        return generic_reply
 
-    except Exception as e:
-        logger.error(f"[FORGOT-PW] Unexpected error in send_password_reset_otp: {e}")
-        import traceback
-        traceback.print_exc()
-        return json_error(f'Server error: {str(e)}', status=500)
+    except Exception:
+        logger.exception("[FORGOT-PW] Unexpected error in send_password_reset_otp")
+        return json_error('Server error', status=500)
 
 
 @auth_bp.route('/api/forgot-password/verify-otp', methods=['POST'])
 @rate_limit(calls=10, period=120)
+@rate_limit(calls=OTP_VERIFY_CALLS_PER_EMAIL, period=OTP_VERIFY_WINDOW, by=_session_email_bucket('reset_email'))
 def verify_password_reset_otp():
     """Verify OTP code."""
     try:
@@ -568,43 +595,34 @@ def verify_password_reset_otp():
         if not otp or len(otp) != 6:
             return json_error('Please enter a valid 6-digit OTP', status=400)
 
-        # Get the latest unused OTP for this email
-        otp_record = db.execute_one(
-            'SELECT * FROM password_reset_otp WHERE email = ? AND used = 0 ORDER BY created_at DESC LIMIT 1',
-            (email,)
+        # Claim the latest live OTP and count this attempt in one statement;
+        # expired rows are filtered here and purged by the background sweep
+        # The fifth attempt also retires the row (a correct code is marked used below
+        # anyway), so a failed last attempt needs no follow-up write
+        otp_record = db.execute_returning(
+            """UPDATE password_reset_otp SET attempts = COALESCE(attempts, 0) + 1,
+                      used = CASE WHEN COALESCE(attempts, 0) + 1 >= 5 THEN 1 ELSE used END
+               WHERE id = (SELECT id FROM password_reset_otp
+                           WHERE email = ? AND used = 0 AND expires_at > ?
+                           ORDER BY created_at DESC LIMIT 1)
+               RETURNING id, otp, attempts""",
+            (email, datetime.now())
         )
 
         if not otp_record:
-            return json_error('No active OTP found. Please request a new one.', status=400)
+            return json_error('No active OTP found or it has expired. Please request a new one.', status=400)
 
         # Check attempt limit (max 5)
-        attempts = otp_record.get('attempts', 0) or 0
-        if attempts >= 5:
-            db.execute_update('UPDATE password_reset_otp SET used = 1 WHERE id = ?', (otp_record['id'],))
+        attempts = otp_record['attempts']
+        if attempts > 5:
             return json_error('Too many attempts. Please request a new OTP.', status=429)
 
-        # Check expiry
-        try:
-            expires_at = datetime.fromisoformat(str(otp_record['expires_at']))
-            if datetime.now() > expires_at:
-                db.execute_update('UPDATE password_reset_otp SET used = 1 WHERE id = ?', (otp_record['id'],))
-                return json_error('OTP has expired. Please request a new one.', status=400)
-        except (ValueError, TypeError):
-            return json_error('OTP record invalid. Please request a new one.', status=400)
-
-        # Increment attempt counter
-        db.execute_update(
-            'UPDATE password_reset_otp SET attempts = ? WHERE id = ?',
-            (attempts + 1, otp_record['id'])
-        )
-
         # Verify OTP hash
         if not email_service.verify_otp(otp_record['otp'], otp):
-            remaining = 4 - attempts
+            remaining = 5 - attempts
             if remaining > 0:
                 return json_error(f'Incorrect OTP. {remaining} attempt(s) remaining.', status=400)
             else:
-                db.execute_update('UPDATE password_reset_otp SET used = 1 WHERE id = ?', (otp_record['id'],))
                 return json_error('Too many failed attempts. Please request a new OTP.', status=429)
 
         # OTP verified — mark as used and set session flag
@@ -613,11 +631,9 @@ def verify_password_reset_otp():
         logger.info(f"[FORGOT-PW] OTP verified for {email}")
         return json_success('OTP verified successfully')
 
-    except Exception as e:
-        logger.error(f"[FORGOT-PW] Unexpected error in verify_password_reset_otp: {e}")
-        import traceback
-        traceback.print_exc()
-        return json_error(f'Server error: {str(e)}', status=500)
+    except Exception:
+        logger.exception("[FORGOT-PW] Unexpected error in verify_password_reset_otp")
+        return json_error('Server error', status=500)
 
 
 @auth_bp.route('/api/forgot-password/resend-otp', methods=['POST'])
@@ -632,55 +648,28 @@ def resend_password_reset_otp():
             return json_error('Session expired. Please start over.', status=400)
 
         # 60-second cooldown check
-        last_otp = db.execute_one(
-            'SELECT created_at FROM password_reset_otp WHERE email = ? ORDER BY created_at DESC LIMIT 1',
-            (email,)
-        )
-        if last_otp:
-            try:
-                last_time = datetime.fromisoformat(str(last_otp['created_at']))
-                elapsed = (datetime.now() - last_time).total_seconds()
-                if elapsed < 60:
-                    wait = int(60 - elapsed)
-                    return json_error(f'Please wait {wait} seconds before resending', status=429)
-            except (ValueError, TypeError):
-                pass
-
-        # Check user still exists
+        wait = _otp_cooldown_left('password_reset', email)
+        if wait:
+            return json_error(f'Please wait {wait} seconds before resending', status=429)
+        _start_otp_cooldown('password_reset', email)
+
+        # Check user still exists (same reply and cooldown either way, as in send_password_reset_otp)
         user = db.execute_one('SELECT id FROM users WHERE email = ?', (email,))
         if not user:
-            return json_error('Account not found', status=400)
-
-        # Invalidate old OTPs
-        db.execute_update(
-            'UPDATE password_reset_otp SET used = 1 WHERE email = ? AND used = 0',
-            (email,)
-        )
-
-        # Generate and store new OTP
-        otp = email_service.generate_otp()
-        otp_hash = email_service.hash_otp(otp)
-        expires_at = email_service.get_otp_expiry()
+            return json_success('New OTP sent to your email')
 
-        db.execute_insert(
-            'INSERT INTO password_reset_otp (email, otp, expires_at, used, attempts) VALUES (?, ?, ?, 0, 0)',
-            (email, otp_hash, expires_at)
-        )
+        # Generate new OTP; invalidate old ones and store it in one statement
+        with db.transaction(durable=False) as tx:
+            otp = _rotate_reset_otp(tx, email)
         logger.info(f"[FORGOT-PW] New OTP generated and stored for {email}")
 
-        if email_service.send_otp_email(email, otp):
-            session.pop('otp_verified', None)
-            logger.info(f"[FORGOT-PW] Resent OTP to {email}")
-            return json_success('New OTP sent to your email')
-        else:
-            logger.error(f"[FORGOT-PW] Failed to resend OTP email to {email}")
-            return json_error('Failed to send email. Please try again later.', status=500)
+        _queue_otp_email(email, otp, 'password_reset', 'FORGOT-PW')
+        session.pop('otp_verified', None)
+        return json_success('New OTP sent to your email')
 
-    except Exception as e:
-        logger.error(f"[FORGOT-PW] Unexpected error in resend_password_reset_otp: {e}")
-        import traceback
-        traceback.print_exc()
-        return json_error(f'Server error: {str(e)}', status=500)
+    except Exception:
+        logger.exception("[FORGOT-PW] Unexpected error in resend_password_reset_otp")
+        return json_error('Server error', status=500)
 
 
 @auth_bp.route('/api/forgot-password/reset-password', methods=['POST'])
@@ -717,6 +706,7 @@ def reset_password_submit():
         # Update password
         password_hash = hash_password(new_password)
         db.execute_update('UPDATE users SET password_hash = ? WHERE email = ?', (password_hash, email))
+        login_cache.pop(email)
 
         # Clear session
         session.pop('reset_email', None)
@@ -725,11 +715,9 @@ def reset_password_submit():
         logger.info(f"[FORGOT-PW] Password reset successful for {email}")
         return json_success('Password reset successful! You can now log in with your new password.')
 
-    except Exception as e:
-        logger.error(f"[FORGOT-PW] Unexpected error in reset_password_submit: {e}")
-        import traceback
-        traceback.print_exc()
-        return json_error(f'Server error: {str(e)}', status=500)
+    except Exception:
+        logger.exception("[FORGOT-PW] Unexpected error in reset_password_submit")
+        return json_error('Server error', status=500)
 
 
 # ============================================================================
@@ -100,18 +100,32 @@ async function sendAIMessage() {
     messagesContainer.scrollTop = messagesContainer.scrollHeight;
 
     try {
-        const response = await fetch('/api/chatbot', {
+        let response = await fetch('/api/chatbot', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json'
             },
-            body: JSON.stringify({ prompt })
+            body: JSON.stringify({ prompt, async: true })
         });
 
-        // Handle non-OK responses and show returned error messages
-        if (!response.ok) {
+        // The answer is generated as a background job; poll until it is ready (at most ~2 minutes)
+        const maxPolls = 120;
+        let polls = 0;
+        while (response.status === 202 && polls < maxPolls) {
+            const { task_id } = await response.json();
+            await new Promise(resolve => setTimeout(resolve, 1000));
+            response = await fetch(`/api/chatbot/result/${task_id}`);
+            polls++;
+        }
+
+        // Handle non-OK responses (or a job that never finished) and show returned error messages
+        if (!response.ok || response.status === 202) {
             let err = { error: 'AI service error' };
-            try { err = await response.json(); } catch (e) { /* ignore JSON parse */ }
+            if (response.status === 202) {
+                err = { error: 'The AI is taking too long to answer. Please try again.' };
+            } else {
+                try { err = await response.json(); } catch (e) { /* ignore JSON parse */ }
+            }
             const loading = document.getElementById('ai-loading');
             if (loading) loading.remove();
             const errorMessage = document.createElement('div');
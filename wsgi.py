@@ -16,12 +16,13 @@ if os.path.exists(secret_env_path):
     print("Loaded secret file from /etc/secrets/.env")
 
 # Import Flask app
-from app import app
+from app import app, start_background_jobs
 
 def create_app():
     """Create and configure the Flask application."""
     # Database tables are managed by Flask-Migrate.
     # Run 'flask db upgrade' to create/update tables before first start.
+    start_background_jobs()
     return app
 
 # WSGI application object for Gunicorn